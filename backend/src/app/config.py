@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -11,10 +12,23 @@ class Settings(BaseSettings):
     )
 
     database_url: str = "sqlite:///./pixelscale.db"
+    # Create missing tables on startup. Every worker process does this, so
+    # multi-worker deployments disable it and run `make init-db` once instead.
+    auto_create_tables: bool = True
 
     s3_bucket_raw: str = "pixelscale-raw"
     s3_bucket_processed: str = "pixelscale-processed"
     aws_region: str = "us-east-1"
+    # Public base URL (bucket website or CDN) for the processed bucket; when
+    # set, processed images are linked directly instead of being presigned
+    s3_public_base_url: str | None = None
+
+    # Encoder for processed images; "vips" needs the optional vips extra
+    image_backend: Literal["pillow", "vips"] = "pillow"
+
+    # Worker threads for blocking work (S3 calls, image processing); matches
+    # the S3 connection pool so every thread can hold a connection
+    threadpool_size: int = 64
 
     use_local_storage: bool = False
     local_storage_path: str = "./uploads"
@@ -23,6 +37,11 @@ class Settings(BaseSettings):
     jwt_secret_key: str = "CHANGE_ME_TO_A_SECURE_RANDOM_STRING"
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    # bcrypt work factor for new password hashes (2^rounds iterations);
+    # existing hashes keep the cost they were created with
+    bcrypt_rounds: int = 12
+    # Hasher for new passwords; with "argon2", bcrypt hashes are upgraded on login
+    password_hasher: Literal["bcrypt", "argon2"] = "bcrypt"
 
     # Logging Configuration
     log_level: str = "INFO"
@@ -1,9 +1,14 @@
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from collections import Counter
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager, joinedload
 
 from .logging_config import get_logger
-from .models import Image, ImageStatus, User
-from .services.auth import get_password_hash, hash_username, get_username_display
+from .models import Image, ImageStatus, StorageRef, User
+from .services.auth import evict_cached_user, get_password_hash, hash_username, get_username_display
+from .services.s3 import extract_key
 
 logger = get_logger(__name__)
 
@@ -20,7 +25,7 @@ class NoEditToRevertError(Exception):
 
 
 # User CRUD operations
-def create_user(db: Session, username: str, password: str, email: str | None = None) -> User:
+async def create_user(db: AsyncSession, username: str, password: str, email: str | None = None) -> User:
     """Create a new user with hashed username and password."""
     hashed_password = get_password_hash(password)
     hashed_username = hash_username(username)
@@ -31,145 +36,211 @@ def create_user(db: Session, username: str, password: str, email: str | None = N
         hashed_password=hashed_password,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     logger.info(f"Created user: {get_username_display(username)}")
     return user
 
 
-def get_user_by_username(db: Session, username: str) -> User | None:
+async def update_user_password(db: AsyncSession, user: User, password: str) -> None:
+    """Re-hash a user's password with the configured hasher."""
+    user.hashed_password = get_password_hash(password)
+    await db.commit()
+    # Token lookups must not keep serving the old row for the cache TTL
+    evict_cached_user(user.username)
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> User | None:
     """Find user by username (hashes input before lookup)."""
     hashed_username = hash_username(username)
-    return db.query(User).filter(User.username == hashed_username).first()
+    return await db.scalar(select(User).where(User.username == hashed_username))
 
 
-def get_user_by_email(db: Session, email: str) -> User | None:
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str) -> User | None:
+    return await db.scalar(select(User).where(User.email == email))
 
 
-def get_user_by_id(db: Session, user_id: int) -> User | None:
-    return db.query(User).filter(User.id == user_id).first()
+async def get_user_by_id(db: AsyncSession, user_id: int) -> User | None:
+    return await db.get(User, user_id)
 
 
 # Image CRUD operations (now with user ownership)
-def create_image(
-    db: Session,
+async def create_image(
+    db: AsyncSession,
     filename: str,
     s3_key_raw: str,
     user_id: int,
+    status: ImageStatus = ImageStatus.PENDING,
+    s3_url_processed: str | None = None,
+    options: dict | None = None,
 ) -> Image:
-    max_index = db.query(func.max(Image.user_index)).filter(Image.user_id == user_id).scalar()
+    """Insert an image row.
+
+    Callers that already know the processing outcome pass it in so the row
+    is written with a single INSERT instead of an INSERT plus UPDATE.
+    """
+    max_index = await db.scalar(
+        select(func.max(Image.user_index)).where(Image.user_id == user_id)
+    )
     next_index = (max_index or 0) + 1
     
     image = Image(
         filename=filename,
         s3_key_raw=s3_key_raw,
-        status=ImageStatus.PENDING,
+        s3_url_processed=s3_url_processed,
+        status=status,
+        options=options,
         user_id=user_id,
         user_index=next_index,
     )
     db.add(image)
-    db.commit()
-    db.refresh(image)
+    await db.commit()
+    await db.refresh(image)
     return image
 
 
-def get_image(db: Session, image_id: int, user_id: int | None = None) -> Image | None:
-    query = db.query(Image).filter(Image.id == image_id)
+async def get_image(db: AsyncSession, image_id: int, user_id: int | None = None) -> Image | None:
+    query = select(Image).where(Image.id == image_id)
     if user_id is not None:
-        query = query.filter(Image.user_id == user_id)
-    return query.first()
+        query = query.where(Image.user_id == user_id)
+    return await db.scalar(query)
 
 
-def get_images(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> list[Image]:
-    return (
-        db.query(Image)
-        .filter(Image.user_id == user_id)
-        .filter(Image.status == ImageStatus.COMPLETED)
-        .order_by(Image.upload_date.desc())
+async def get_images(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100) -> list[Image]:
+    result = await db.scalars(
+        select(Image)
+        .where(Image.user_id == user_id)
+        .where(Image.status == ImageStatus.COMPLETED)
+        .order_by(Image.upload_date.desc(), Image.id.desc())
         .offset(skip)
         .limit(limit)
-        .all()
     )
+    return list(result)
 
 
-def update_image_processed(
-    db: Session,
+async def update_image_edited(
+    db: AsyncSession,
     image_id: int,
-    s3_url_processed: str,
+    s3_url_edited: str,
     options: dict | None = None,
 ) -> Image | None:
-    image = db.query(Image).filter(Image.id == image_id).first()
+    image = await db.get(Image, image_id)
     if image:
-        image.s3_url_processed = s3_url_processed
-        image.status = ImageStatus.COMPLETED
+        image.s3_url_edited = s3_url_edited
         if options:
             image.options = options
-        db.commit()
-        db.refresh(image)
+        await db.commit()
     return image
 
 
-def update_image_failed(db: Session, image_id: int) -> Image | None:
-    image = db.query(Image).filter(Image.id == image_id).first()
-    if image:
-        image.status = ImageStatus.FAILED
-        db.commit()
-        db.refresh(image)
-    return image
+async def delete_image(db: AsyncSession, image_id: int, user_id: int) -> bool:
+    # Single owner-scoped DELETE; no need to load the row first
+    result = await db.execute(
+        delete(Image).where(Image.id == image_id, Image.user_id == user_id)
+    )
+    await db.commit()
+    return result.rowcount > 0
 
 
-def update_image_edited(
-    db: Session,
-    image_id: int,
-    s3_url_edited: str,
-    options: dict | None = None,
-) -> Image | None:
-    image = db.query(Image).filter(Image.id == image_id).first()
-    if image:
-        image.s3_url_edited = s3_url_edited
-        if options:
-            image.options = options
-        db.commit()
-        db.refresh(image)
-    return image
+async def acquire_storage_refs(db: AsyncSession, keys: list[str]) -> set[str]:
+    """Count one more reference to each storage key and commit.
 
+    Returns the keys that had no reference before this call. Releasing a key's
+    last reference commits before its object is deleted, so an object found
+    under a newly referenced key may be about to go; callers write those
+    objects instead of trusting an existence check.
+    """
+    created = set()
+    for key in keys:
+        bump = update(StorageRef).where(StorageRef.key == key).values(refs=StorageRef.refs + 1)
+        if (await db.execute(bump)).rowcount:
+            continue
+        try:
+            async with db.begin_nested():
+                db.add(StorageRef(key=key, refs=1))
+            created.add(key)
+        except IntegrityError:
+            # Created by a concurrent request since the UPDATE
+            await db.execute(bump)
+    await db.commit()
+    return created
+
+
+async def release_storage_refs(db: AsyncSession, keys: list[str]) -> set[str]:
+    """Drop one reference to each storage key; return the keys left unreferenced.
+
+    Nothing is committed. The caller commits together with the row change
+    that dropped the references and deletes the returned objects afterwards:
+    a failed delete leaks an object, whereas deleting first and then failing
+    to commit would leave rows pointing at missing objects.
+    """
+    if not keys:
+        return set()
+    for key in keys:
+        await db.execute(
+            update(StorageRef).where(StorageRef.key == key).values(refs=StorageRef.refs - 1)
+        )
+    orphaned = set(await db.scalars(
+        select(StorageRef.key).where(StorageRef.key.in_(keys), StorageRef.refs <= 0)
+    ))
+    if orphaned:
+        await db.execute(delete(StorageRef).where(StorageRef.key.in_(orphaned)))
+    return orphaned
+
+
+async def backfill_storage_refs(db: AsyncSession) -> int:
+    """Create reference counts for images stored before keys were counted.
+
+    Only images whose raw key has no count are read. Their processed and
+    edited keys are derived from that raw key, so no counted image shares
+    them except through an edit made since, which already has its own count.
+    Returns the number of keys added.
+    """
+    rows = await db.execute(
+        select(Image.s3_key_raw, Image.s3_url_processed, Image.s3_url_edited)
+        .outerjoin(StorageRef, StorageRef.key == Image.s3_key_raw)
+        .where(StorageRef.key.is_(None))
+    )
+    counts = Counter()
+    for raw_key, *urls in rows:
+        counts[raw_key] += 1
+        counts.update(extract_key(url)[1] for url in urls if url)
+    if not counts:
+        return 0
 
-def delete_image(db: Session, image_id: int, user_id: int) -> bool:
-    image = get_image(db, image_id, user_id)
-    if image:
-        db.delete(image)
-        db.commit()
-        return True
-    return False
+    counted = set(await db.scalars(select(StorageRef.key).where(StorageRef.key.in_(counts))))
+    added = [StorageRef(key=key, refs=refs) for key, refs in counts.items() if key not in counted]
+    db.add_all(added)
+    await db.commit()
+    logger.info(f"Backfilled reference counts for {len(added)} stored objects")
+    return len(added)
 
 
-def toggle_favorite(db: Session, image_id: int, user_id: int) -> Image | None:
-    image = get_image(db, image_id, user_id)
+async def toggle_favorite(db: AsyncSession, image_id: int, user_id: int) -> Image | None:
+    image = await get_image(db, image_id, user_id)
     if image:
         image.is_favorite = not image.is_favorite
-        db.commit()
-        db.refresh(image)
+        await db.commit()
     return image
 
 
-def get_favorite_images(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> list[Image]:
-    return (
-        db.query(Image)
-        .filter(Image.user_id == user_id)
-        .filter(Image.status == ImageStatus.COMPLETED)
-        .filter(Image.is_favorite == True)
-        .order_by(Image.upload_date.desc())
+async def get_favorite_images(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100) -> list[Image]:
+    result = await db.scalars(
+        select(Image)
+        .where(Image.user_id == user_id)
+        .where(Image.status == ImageStatus.COMPLETED)
+        .where(Image.is_favorite == True)
+        .order_by(Image.upload_date.desc(), Image.id.desc())
         .offset(skip)
         .limit(limit)
-        .all()
     )
+    return list(result)
 
 
 # Share Link CRUD operations
-def create_share_link(
-    db: Session,
+async def create_share_link(
+    db: AsyncSession,
     image_id: int,
     duration: str,
     version: str = "edited",
@@ -193,50 +264,55 @@ def create_share_link(
         expires_at=expires_at,
     )
     db.add(share_link)
-    db.commit()
-    db.refresh(share_link)
+    await db.commit()
+    await db.refresh(share_link)
     return share_link
 
 
-def get_share_link(db: Session, share_id: str) -> "ShareLink | None":
+async def get_share_link(db: AsyncSession, share_id: str) -> "ShareLink | None":
     from .models import ShareLink
-    return db.query(ShareLink).filter(ShareLink.id == share_id).first()
+    return await db.scalar(
+        select(ShareLink)
+        .options(joinedload(ShareLink.image))
+        .where(ShareLink.id == share_id)
+    )
 
 
-def get_share_link_by_user(db: Session, share_id: str, user_id: int) -> "ShareLink | None":
+async def get_share_link_by_user(db: AsyncSession, share_id: str, user_id: int) -> "ShareLink | None":
     """Get share link only if owned by the specified user."""
     from .models import ShareLink
-    return (
-        db.query(ShareLink)
+    return await db.scalar(
+        select(ShareLink)
         .join(Image)
-        .filter(ShareLink.id == share_id)
-        .filter(Image.user_id == user_id)
-        .first()
+        .where(ShareLink.id == share_id)
+        .where(Image.user_id == user_id)
     )
 
 
-def get_share_links_by_user(db: Session, user_id: int) -> list:
-    """Get all share links for a user's images."""
+async def get_share_links_by_user(db: AsyncSession, user_id: int) -> list:
+    """Get all share links for a user's images, with each link's image loaded."""
     from .models import ShareLink
-    return (
-        db.query(ShareLink)
-        .join(Image)
-        .filter(Image.user_id == user_id)
+    # Populate link.image from the join itself, avoiding a query per link
+    result = await db.scalars(
+        select(ShareLink)
+        .join(ShareLink.image)
+        .options(contains_eager(ShareLink.image))
+        .where(Image.user_id == user_id)
         .order_by(ShareLink.created_at.desc())
-        .all()
     )
+    return list(result)
 
 
-def delete_share_link(db: Session, share_id: str, user_id: int) -> bool:
-    share_link = get_share_link_by_user(db, share_id, user_id)
+async def delete_share_link(db: AsyncSession, share_id: str, user_id: int) -> bool:
+    share_link = await get_share_link_by_user(db, share_id, user_id)
     if share_link:
-        db.delete(share_link)
-        db.commit()
+        await db.delete(share_link)
+        await db.commit()
         return True
     return False
 
 
-def delete_edited_share_links(db: Session, image_id: int, user_id: int) -> int:
+async def delete_edited_share_links(db: AsyncSession, image_id: int, user_id: int) -> int:
     """Delete all share links for edited version of an image.
     
     Verifies ownership before deletion. Returns 0 if unauthorized or image not found.
@@ -244,19 +320,21 @@ def delete_edited_share_links(db: Session, image_id: int, user_id: int) -> int:
     from .models import ShareLink
     
     # Verify ownership
-    image = db.query(Image).filter(Image.id == image_id).first()
+    image = await db.get(Image, image_id)
     if not image or image.user_id != user_id:
         return 0
     
-    result = db.query(ShareLink).filter(
-        ShareLink.image_id == image_id,
-        ShareLink.version == "edited"
-    ).delete()
-    db.commit()
-    return result
+    result = await db.execute(
+        delete(ShareLink).where(
+            ShareLink.image_id == image_id,
+            ShareLink.version == "edited",
+        )
+    )
+    await db.commit()
+    return result.rowcount
 
 
-def revert_image_edit(db: Session, image_id: int, user_id: int) -> Image:
+async def revert_image_edit(db: AsyncSession, image_id: int, user_id: int) -> Image:
     """Clear the edited image URL and return the updated image.
     
     Args:
@@ -271,7 +349,7 @@ def revert_image_edit(db: Session, image_id: int, user_id: int) -> Image:
         ImageNotFoundError: If the image doesn't exist or isn't owned by the user
         NoEditToRevertError: If the image exists but has no edited version
     """
-    image = get_image(db, image_id, user_id)
+    image = await get_image(db, image_id, user_id)
     if not image:
         raise ImageNotFoundError(f"Image {image_id} not found or not owned by user {user_id}")
     
@@ -279,6 +357,5 @@ def revert_image_edit(db: Session, image_id: int, user_id: int) -> Image:
         raise NoEditToRevertError(f"Image {image_id} has no edits to revert")
     
     image.s3_url_edited = None
-    db.commit()
-    db.refresh(image)
+    await db.commit()
     return image
@@ -1,29 +1,55 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase
 
 from .config import get_settings
 
 settings = get_settings()
 
-connect_args = {}
-if settings.database_url.startswith("sqlite"):
-    connect_args["check_same_thread"] = False
+# DATABASE_URL keeps the familiar sync form; map each dialect to its async driver
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
 
-engine = create_engine(
-    settings.database_url,
+
+def get_async_database_url(url: str) -> str:
+    """Rewrite a database URL to use the async driver for its dialect."""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+engine = create_async_engine(
+    get_async_database_url(settings.database_url),
     pool_pre_ping=True,
-    connect_args=connect_args,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay loaded after commit so attributes can be read without
+# another round-trip (lazy loads are not available under asyncio)
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
 
-Base = declarative_base()
+class Base(DeclarativeBase):
+    pass
 
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def init_db() -> None:
+    """Create any missing tables for the registered models.
+
+    Also counts references to objects stored before storage_refs existed, so
+    deleting those images removes their objects.
+    """
+    from . import crud, models  # noqa: F401  # register tables on Base.metadata
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        await crud.backfill_storage_refs(db)
@@ -6,10 +6,13 @@ Provides:
 - Console handler for local development
 - CloudWatch handler for production (when enabled)
 - Request correlation ID support
+- Queue-based dispatch so handler I/O runs on a background thread
 """
 
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from contextvars import ContextVar
 from functools import lru_cache
 
@@ -18,15 +21,31 @@ from .config import get_settings
 # Context variable for request correlation ID
 correlation_id_var: ContextVar[str | None] = ContextVar("correlation_id", default=None)
 
+# Library loggers that emit inside a request and should share our handlers
+THIRD_PARTY_LOGGERS = ("uvicorn.access", "uvicorn.error", "sqlalchemy.engine")
+
 
 class CorrelationIdFilter(logging.Filter):
     """Filter that adds correlation_id to log records."""
 
     def filter(self, record: logging.LogRecord) -> bool:
-        record.correlation_id = correlation_id_var.get() or "-"
+        # Keep an ID stamped earlier in the request context (see LocalQueueHandler)
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = correlation_id_var.get() or "-"
         return True
 
 
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler for an in-process queue.
+    Skips the default prepare() step, which formats the record in the caller's
+    thread for pickling; formatting is left to the listener thread instead.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
 class PlainTextFormatter(logging.Formatter):
     """
     Plain text formatter with timestamps and categories.
@@ -55,11 +74,14 @@ class SensitiveDataFilter(logging.Filter):
 
     def filter(self, record: logging.LogRecord) -> bool:
         if isinstance(record.msg, str):
-            msg_lower = record.msg.lower()
+            # Merge lazy %-style args so values passed as arguments are checked too
+            msg = record.getMessage() if record.args else record.msg
+            msg_lower = msg.lower()
             for pattern in self.SENSITIVE_PATTERNS:
                 if pattern in msg_lower:
                     # Redact values after sensitive keywords
-                    record.msg = self._redact_sensitive(record.msg)
+                    record.msg = self._redact_sensitive(msg)
+                    record.args = None
                     break
         return True
 
@@ -124,39 +146,52 @@ def get_cloudwatch_handler() -> logging.Handler | None:
 
 
 @lru_cache(maxsize=1)
-def setup_logging() -> None:
+def setup_logging() -> QueueListener:
     """
     Configure application-wide logging.
     Should be called once at application startup.
+
+    Loggers only enqueue records; the returned listener owns the actual
+    handlers and must be started (and stopped on shutdown) by the caller.
     """
     settings = get_settings()
 
     # Get log level from settings
     log_level = getattr(logging, settings.log_level.upper(), logging.INFO)
 
+    # Console handler (always) and CloudWatch handler (if enabled)
+    handlers = [get_console_handler()]
+    cloudwatch_handler = get_cloudwatch_handler()
+    if cloudwatch_handler:
+        handlers.append(cloudwatch_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LocalQueueHandler(log_queue)
+    # Correlation ID lives in a context variable, so capture it before the
+    # record leaves the request's context
+    queue_handler.addFilter(CorrelationIdFilter())
+
     # Configure root logger for our app
     app_logger = logging.getLogger("src.app")
     app_logger.setLevel(log_level)
     app_logger.handlers.clear()
+    app_logger.addHandler(queue_handler)
 
-    # Add console handler (always)
-    app_logger.addHandler(get_console_handler())
-
-    # Add CloudWatch handler (if enabled)
-    cloudwatch_handler = get_cloudwatch_handler()
     if cloudwatch_handler:
-        app_logger.addHandler(cloudwatch_handler)
         app_logger.info("CloudWatch logging enabled")
 
     # Prevent propagation to root logger
     app_logger.propagate = False
 
-    # Also configure uvicorn access logs to use our format
-    uvicorn_access = logging.getLogger("uvicorn.access")
-    uvicorn_access.handlers.clear()
-    uvicorn_access.addHandler(get_console_handler())
-    if cloudwatch_handler:
-        uvicorn_access.addHandler(cloudwatch_handler)
+    # Also route server and database logs through our queue so they use our
+    # format and carry the request's correlation ID
+    for name in THIRD_PARTY_LOGGERS:
+        third_party = logging.getLogger(name)
+        third_party.handlers.clear()
+        third_party.addHandler(queue_handler)
+        third_party.propagate = False
+
+    return QueueListener(log_queue, *handlers, respect_handler_level=True)
 
 
 def get_logger(name: str) -> logging.Logger:
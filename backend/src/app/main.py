@@ -1,36 +1,94 @@
+from contextlib import asynccontextmanager
+from operator import itemgetter
 from pathlib import Path
 
+import orjson
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 from .config import get_settings
-from .database import Base, engine
+from .database import engine, init_db
 from .logging_config import get_logger, setup_logging
+from .middleware.body_size_limit import BodySizeLimitMiddleware
 from .middleware.caching_static import CachingStaticFiles
 from .middleware.logging_middleware import LoggingMiddleware
 from .routers import auth, health, images, share, stress
 from .routers.auth import limiter
+from .services import s3
+from .services.image_processor import warm_up_color_kernel
 
 # Initialize logging before anything else
-setup_logging()
+log_listener = setup_logging()
 logger = get_logger(__name__)
 
 settings = get_settings()
 
-Base.metadata.create_all(bind=engine)
+def _build_root_payload(app: FastAPI) -> dict:
+    # (path, method, name) tuples sort in C; dicts are only built afterwards
+    routes = []
+    for route in app.routes:
+        if hasattr(route, "methods") and hasattr(route, "path"):
+            for method in route.methods:
+                if method != "HEAD":
+                    routes.append((route.path, method, route.name))
+    routes.sort(key=itemgetter(0, 1))
+
+    return {
+        "name": "PixelScale API",
+        "version": "1.0.0",
+        "docs": "/docs",
+        "openapi": "/openapi.json",
+        "endpoints": [
+            {"method": method, "path": path, "name": name}
+            for path, method, name in routes
+        ],
+    }
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Records logged before startup are buffered in the queue until now
+    log_listener.start()
+    # run_in_threadpool and sync routes share this limiter (40 threads by default)
+    to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+    await to_thread.run_sync(warm_up_color_kernel)
+    # Convenience for single-process setups; see AUTO_CREATE_TABLES
+    if settings.auto_create_tables:
+        await init_db()
+    # Routes are fixed once the app starts, so the index is built only once
+    app.state.root_payload = orjson.dumps(_build_root_payload(app))
+    try:
+        yield
+    finally:
+        s3.shutdown_transfer_manager()
+        await engine.dispose()
+        log_listener.stop()
+
 
 app = FastAPI(
     title="PixelScale API",
     description="Image hosting and processing platform",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Rate limiter
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Refuse oversized uploads from Content-Length, before the form is parsed.
+# Added before CORSMiddleware so CORS wraps it and its 413 carries CORS headers.
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=images.MAX_UPLOAD_BODY_SIZE,
+    paths=frozenset({"/api/upload"}),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -44,6 +102,9 @@ from starlette.middleware.gzip import GZipMiddleware
 app.add_middleware(GZipMiddleware, minimum_size=500)
 
 # Add logging middleware (must be after CORS)
+# Every middleware in this stack is pure ASGI and forwards response body
+# messages untouched. Do not add BaseHTTPMiddleware subclasses: they buffer
+# whole responses such as /uploads files and /api/images/{id}/download.
 app.add_middleware(LoggingMiddleware)
 
 logger.info("PixelScale API starting up")
@@ -63,21 +124,4 @@ app.include_router(stress.router)
 
 @app.get("/")
 async def root():
-    routes = []
-    for route in app.routes:
-        if hasattr(route, "methods") and hasattr(route, "path"):
-            for method in route.methods:
-                if method != "HEAD":
-                    routes.append({
-                        "method": method,
-                        "path": route.path,
-                        "name": route.name,
-                    })
-
-    return {
-        "name": "PixelScale API",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "openapi": "/openapi.json",
-        "endpoints": sorted(routes, key=lambda x: (x["path"], x["method"])),
-    }
+    return Response(content=app.state.root_payload, media_type="application/json")
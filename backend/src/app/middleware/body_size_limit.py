@@ -0,0 +1,64 @@
+"""Reject oversized request bodies before they are buffered.
+
+FastAPI parses multipart forms before the endpoint (or any dependency) runs,
+so a size check inside the handler only fires after the whole body has been
+received and spooled. This middleware answers 413 from the Content-Length
+header alone, and stops chunked bodies as soon as they cross the limit.
+"""
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class _BodyTooLarge(HTTPException):
+    """Raised from receive(); an HTTPException so body parsers re-raise it as-is."""
+
+
+class BodySizeLimitMiddleware:
+    """Pure ASGI middleware enforcing a maximum request body size on given paths."""
+
+    def __init__(self, app: ASGIApp, max_body_size: int, paths: frozenset[str]) -> None:
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = paths
+        self._detail = f"Request body too large. Max {max_body_size} bytes."
+        self._too_large = JSONResponse({"detail": self._detail}, status_code=413)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for key, value in scope["headers"]:
+            if key == b"content-length":
+                if not value.isdigit() or int(value) > self.max_body_size:
+                    await self._too_large(scope, receive, send)
+                    return
+                break
+
+        # Content-Length may be absent (chunked) or understated; count as we go
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise _BodyTooLarge(status_code=413, detail=self._detail)
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, send_wrapper)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self._too_large(scope, receive, send)
@@ -1,31 +1,44 @@
 """Custom StaticFiles class with cache headers for immutable image assets."""
 
-from starlette.responses import Response
 from starlette.staticfiles import StaticFiles
+from starlette.types import Message, Receive, Scope, Send
 
 
 class CachingStaticFiles(StaticFiles):
     """StaticFiles subclass that adds Cache-Control headers for immutable assets.
-    
+
     Since processed images are immutable (reprocessing creates new keys),
     we can safely cache them for a long duration.
+
+    Conditional requests are answered by StaticFiles itself: it compares
+    If-None-Match / If-Modified-Since against a stat-based ETag and returns
+    304 without opening the file. The stat-based tag stays correct when an
+    edit rewrites an existing key, which a filename-derived tag would not.
     """
-    
+
     def __init__(self, *args, max_age: int = 31536000, **kwargs):
         """Initialize with configurable cache max-age.
-        
+
         Args:
             max_age: Cache duration in seconds. Default is 1 year (31536000s).
         """
         super().__init__(*args, **kwargs)
         self.max_age = max_age
-    
-    async def get_response(self, path: str, scope) -> Response:
-        """Get response with cache headers added."""
-        response = await super().get_response(path, scope)
-        
-        # Add cache headers for successful responses
-        if response.status_code == 200:
-            response.headers["Cache-Control"] = f"public, max-age={self.max_age}, immutable"
-        
-        return response
+        # Constant per instance, so build the raw header once
+        self._cache_control_header = (
+            b"cache-control",
+            f"public, max-age={max_age}, immutable".encode("latin-1"),
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serve the file, appending Cache-Control to the raw response headers."""
+
+        async def send_wrapper(message: Message) -> None:
+            # Add cache headers for successful and revalidated responses
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if 200 <= status < 300 or status == 304:
+                    message.setdefault("headers", []).append(self._cache_control_header)
+            await send(message)
+
+        await super().__call__(scope, receive, send_wrapper)
@@ -7,104 +7,158 @@ Logs:
 - Client IP address
 - User ID (encrypted) if authenticated
 - Redacts sensitive headers
+
+Implemented as a pure ASGI middleware so requests are not wrapped in an extra
+task and Request/Response objects are never materialized on the hot path.
+Only http.response.start is inspected; http.response.body messages are passed
+straight through, so streamed and file responses are never buffered.
 """
 
+import os
+import random
 import time
-import uuid
-from typing import Callable
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from ..logging_config import correlation_id_var, get_logger
 
 logger = get_logger(__name__)
 
-# Headers to redact from logs
-SENSITIVE_HEADERS = {
-    "authorization",
-    "cookie",
-    "x-api-key",
-    "x-auth-token",
-}
+# Headers to redact from logs (ASGI header names are always lowercased bytes)
+SENSITIVE_HEADERS = frozenset({
+    b"authorization",
+    b"cookie",
+    b"x-api-key",
+    b"x-auth-token",
+})
+
+# High-frequency endpoints (load balancer probes, scrapers) are only logged
+# for a fraction of requests. Failures (exceptions and 5xx responses) are
+# always logged.
+SAMPLED_PATHS = frozenset({"/health", "/api/health", "/metrics"})
+SAMPLE_RATE = 0.1
+
+# Dedicated generator so sampling does not contend on the module-level one
+_sampler = random.Random()
 
 
-class LoggingMiddleware(BaseHTTPMiddleware):
+class LoggingMiddleware:
     """Middleware that logs all requests and responses with correlation IDs."""
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Generate unique correlation ID for this request
-        correlation_id = uuid.uuid4().hex[:12]
+        correlation_id = os.urandom(6).hex()
         correlation_id_var.set(correlation_id)
 
         # Store correlation ID in request state for access in route handlers
-        request.state.correlation_id = correlation_id
+        state = scope.setdefault("state", {})
+        state["correlation_id"] = correlation_id
 
         # Extract request info
-        method = request.method
-        path = request.url.path
-        query = str(request.query_params) if request.query_params else ""
-        client_ip = self._get_client_ip(request)
-
-        # Log request
-        log_msg = f"Request: {method} {path}"
-        if query:
-            log_msg += f"?{query}"
-        log_msg += f" | IP: {client_ip}"
-
-        logger.info(log_msg)
+        method = scope["method"]
+        path = scope["path"]
+        query = scope["query_string"].decode("latin-1")
+        client_ip = self._get_client_ip(scope)
+        should_log = path not in SAMPLED_PATHS or _sampler.random() < SAMPLE_RATE
+
+        # Log request (formatting is deferred until a handler emits the record)
+        if should_log:
+            logger.info(
+                "Request: %s %s%s | IP: %s",
+                method,
+                path,
+                f"?{query}" if query else "",
+                client_ip,
+                extra={"http_method": method, "http_path": path, "client_ip": client_ip},
+            )
+
+        correlation_header = (b"x-correlation-id", correlation_id.encode("latin-1"))
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if should_log or status_code >= 500:
+                    latency_ms = (time.perf_counter() - start_time) * 1000
+
+                    # Get user info if available (will be encrypted username)
+                    user_info = ""
+                    if "user_id" in state:
+                        user_info = f" | User: {state['user_id']}"
+
+                    # Log response
+                    logger.info(
+                        "Response: %s %s | Status: %d | %.1fms%s",
+                        method,
+                        path,
+                        status_code,
+                        latency_ms,
+                        user_info,
+                        extra={"latency_ms": latency_ms, "status_code": status_code},
+                    )
+
+                # Add correlation ID to response headers for debugging
+                message.setdefault("headers", []).append(correlation_header)
+
+            # Body chunks are forwarded as-is so responses keep streaming
+            await send(message)
 
         # Process request and measure latency
         start_time = time.perf_counter()
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
             latency_ms = (time.perf_counter() - start_time) * 1000
-            logger.error(f"Request failed: {method} {path} | {latency_ms:.1f}ms | Error: {str(e)}")
+            logger.error(
+                "Request failed: %s %s | %.1fms | Error: %s | Headers: %s",
+                method,
+                path,
+                latency_ms,
+                e,
+                self._get_safe_headers(scope),
+                extra={"latency_ms": latency_ms},
+            )
             raise
 
-        latency_ms = (time.perf_counter() - start_time) * 1000
-
-        # Get user info if available (will be encrypted username)
-        user_info = ""
-        if hasattr(request.state, "user_id"):
-            user_info = f" | User: {request.state.user_id}"
-
-        # Log response
-        logger.info(
-            f"Response: {method} {path} | Status: {response.status_code} | {latency_ms:.1f}ms{user_info}"
-        )
-
-        # Add correlation ID to response headers for debugging
-        response.headers["X-Correlation-ID"] = correlation_id
-
-        return response
-
-    def _get_client_ip(self, request: Request) -> str:
+    def _get_client_ip(self, scope: Scope) -> str:
         """Extract client IP, handling proxies."""
-        # Check for forwarded header (behind load balancer/proxy)
-        forwarded = request.headers.get("x-forwarded-for")
-        if forwarded:
-            # First IP in the chain is the original client
-            return forwarded.split(",")[0].strip()
+        real_ip = None
+        for key, value in scope["headers"]:
+            # Check for forwarded header (behind load balancer/proxy)
+            if key == b"x-forwarded-for":
+                # First IP in the chain is the original client; only that
+                # slice is decoded
+                comma = value.find(b",")
+                first = (value[:comma] if comma >= 0 else value).strip()
+                if first:
+                    return first.decode("ascii", "replace")
+            elif key == b"x-real-ip" and real_ip is None:
+                real_ip = value
 
         # Check for real IP header
-        real_ip = request.headers.get("x-real-ip")
         if real_ip:
-            return real_ip
+            return real_ip.decode("ascii", "replace")
 
         # Fall back to direct client
-        if request.client:
-            return request.client.host
+        client = scope.get("client")
+        if client:
+            return client[0]
 
         return "unknown"
 
-    def _get_safe_headers(self, request: Request) -> dict:
+    def _get_safe_headers(self, scope: Scope) -> dict:
         """Get headers with sensitive values redacted."""
         safe_headers = {}
-        for key, value in request.headers.items():
-            if key.lower() in SENSITIVE_HEADERS:
-                safe_headers[key] = "[REDACTED]"
+        for key, value in scope["headers"]:
+            name = key.decode("latin-1")
+            if key in SENSITIVE_HEADERS:
+                safe_headers[name] = "[REDACTED]"
             else:
-                safe_headers[key] = value
+                safe_headers[name] = value.decode("latin-1")
         return safe_headers
@@ -1,12 +1,45 @@
 import enum
 from datetime import datetime, timezone
 
-from sqlalchemy import DateTime, Enum, ForeignKey, String, JSON, Boolean
+from sqlalchemy import DateTime, Enum, ForeignKey, Index, String, JSON, Boolean
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.sql.functions import FunctionElement
 
 from .database import Base
 
 
+class utcnow(FunctionElement):
+    """Current UTC time as a naive timestamp, for server-side column defaults.
+
+    now()/CURRENT_TIMESTAMP follow the session time zone on PostgreSQL and
+    MySQL and have whole-second resolution on SQLite, so each dialect gets
+    an explicit UTC, sub-second expression instead.
+    """
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _default_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, "postgresql")
+def _pg_utcnow(element, compiler, **kw):
+    return "(now() AT TIME ZONE 'utc')"
+
+
+@compiles(utcnow, "mysql")
+def _mysql_utcnow(element, compiler, **kw):
+    return "(UTC_TIMESTAMP(6))"
+
+
+@compiles(utcnow, "sqlite")
+def _sqlite_utcnow(element, compiler, **kw):
+    return "(STRFTIME('%Y-%m-%d %H:%M:%f', 'now'))"
+
+
 class ImageStatus(enum.Enum):
     PENDING = "pending"
     COMPLETED = "completed"
@@ -28,7 +61,7 @@ class User(Base):
     hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
+        DateTime, server_default=utcnow(), nullable=False
     )
 
     images: Mapped[list["Image"]] = relationship("Image", back_populates="owner")
@@ -40,6 +73,10 @@ class User(Base):
 
 class Image(Base):
     __tablename__ = "images"
+    __table_args__ = (
+        # Gallery/favorites pages filter by owner and sort newest first
+        Index("ix_images_user_id_upload_date", "user_id", "upload_date"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_index: Mapped[int] = mapped_column(nullable=False, default=1)
@@ -51,7 +88,7 @@ class Image(Base):
         Enum(ImageStatus), default=ImageStatus.PENDING
     )
     upload_date: Mapped[datetime] = mapped_column(
-        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
+        DateTime, server_default=utcnow(), nullable=False
     )
     options: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     is_favorite: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -63,6 +100,21 @@ class Image(Base):
         return f"<Image(id={self.id}, filename={self.filename}, status={self.status})>"
 
 
+class StorageRef(Base):
+    """Number of image fields referencing a content-addressed storage object.
+
+    Identical uploads by one user share their raw and processed objects, so
+    an object is deleted only when its count drops to zero.
+    """
+    __tablename__ = "storage_refs"
+
+    key: Mapped[str] = mapped_column(String(512), primary_key=True)
+    refs: Mapped[int] = mapped_column(nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f"<StorageRef(key={self.key}, refs={self.refs})>"
+
+
 class ShareLink(Base):
     """Shareable link for public access to an image with optional expiration."""
     __tablename__ = "share_links"
@@ -72,9 +124,9 @@ class ShareLink(Base):
         ForeignKey("images.id", ondelete="CASCADE"), nullable=False, index=True
     )
     version: Mapped[str] = mapped_column(String(10), default="edited")
-    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)  # null = never expires
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)  # null = never expires
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
+        DateTime, server_default=utcnow(), nullable=False
     )
 
     image: Mapped["Image"] = relationship("Image")
@@ -3,7 +3,7 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud
 from ..config import get_settings
@@ -17,6 +17,7 @@ from ..services.auth import (
     get_current_user_with_display_name,
     get_username_display,
     hash_username,
+    password_needs_rehash,
     verify_password,
 )
 
@@ -32,20 +33,20 @@ limiter = Limiter(key_func=get_remote_address)
 async def register(
     request: Request,
     user_data: UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Register a new user. Rate limited to 5 requests per minute per IP."""
     user_display = get_username_display(user_data.username)
     
     # Check if username already exists
-    if crud.get_user_by_username(db, user_data.username):
+    if await crud.get_user_by_username(db, user_data.username):
         logger.warning(f"Registration failed: username already exists | User: {user_display}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered",
         )
 
-    user = crud.create_user(
+    user = await crud.create_user(
         db,
         username=user_data.username,
         password=user_data.password,
@@ -57,12 +58,12 @@ async def register(
 @router.post("/login", response_model=Token)
 async def login(
     user_data: UserLogin,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Authenticate user and return JWT token."""
     user_display = get_username_display(user_data.username)
     
-    user = crud.get_user_by_username(db, user_data.username)
+    user = await crud.get_user_by_username(db, user_data.username)
     if not user or not verify_password(user_data.password, user.hashed_password):
         logger.warning(f"Login failed: invalid credentials | User: {user_display}")
         raise HTTPException(
@@ -78,6 +79,11 @@ async def login(
             detail="Inactive user",
         )
 
+    if password_needs_rehash(user.hashed_password):
+        # Lazy migration: the plaintext is only available at login
+        await crud.update_user_password(db, user, user_data.password)
+        logger.info(f"Password hash upgraded | User: {user_display}")
+
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
         data={"sub": user.username, "display_name": user_data.username},
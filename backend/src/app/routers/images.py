@@ -1,16 +1,23 @@
-import uuid
+import asyncio
+import hashlib
+import os
+from collections.abc import Sequence
+from os.path import basename, splitext
 from pathlib import Path
+from typing import BinaryIO
 
-from fastapi import APIRouter, Body, Depends, File, HTTPException, Query, UploadFile
+import orjson
+from fastapi import APIRouter, Body, Depends, File, HTTPException, Query, Request, Response, UploadFile
 from fastapi.responses import FileResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud
 from ..crud import ImageNotFoundError, NoEditToRevertError
 from ..config import get_settings
 from ..database import get_db
 from ..logging_config import get_logger
-from ..models import User
+from ..models import ImageStatus, User
 from ..schemas import (
     FilterType,
     ImageFormat,
@@ -20,31 +27,94 @@ from ..schemas import (
 )
 from ..services import s3
 from ..services.auth import get_current_user, get_current_user_from_token
-from ..services.image_processor import process_image
+from ..services.http_cache import conditional_json_response
+from ..services.image_processor import generate_processed_key, process_image
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/api", tags=["Images"])
 settings = get_settings()
 
-ALLOWED_CONTENT_TYPES = {
+ALLOWED_CONTENT_TYPES = frozenset({
     "image/jpeg",
     "image/png",
     "image/gif",
     "image/webp",
     "image/avif",
-}
-
-
-def _extract_processed_key(s3_url_processed: str) -> str:
-    """Extract the S3 key from a processed URL (works for both local and S3 URLs)."""
-    if s3_url_processed.startswith("/uploads/"):
-        return s3_url_processed.replace("/uploads/", "")
-    # For S3 URLs, extract everything after the bucket domain
-    # URL format: https://{bucket}.s3.{region}.amazonaws.com/{key}
-    if ".amazonaws.com/" in s3_url_processed:
-        return s3_url_processed.split(".amazonaws.com/", 1)[1]
-    # Fallback: return as-is
-    return s3_url_processed
+})
+INVALID_CONTENT_TYPE_DETAIL = f"Invalid file type. Allowed: {', '.join(sorted(ALLOWED_CONTENT_TYPES))}"
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+# Whole-request cap enforced by BodySizeLimitMiddleware; leaves room for the
+# multipart boundaries and part headers around the file
+MAX_UPLOAD_BODY_SIZE = MAX_UPLOAD_SIZE + 64 * 1024
+
+
+def _check_upload_size(file: UploadFile) -> None:
+    """Reject uploads over MAX_UPLOAD_SIZE without reading them into memory."""
+    size = file.size
+    if size is None:
+        # Size unknown: measure the spooled file and rewind for streaming
+        size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+    if size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="File too large. Max 10MB.")
+
+
+def _hash_upload(fileobj: BinaryIO) -> str:
+    fileobj.seek(0)
+    return hashlib.file_digest(fileobj, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+
+
+async def _release_objects(
+    db: AsyncSession,
+    raw_keys: Sequence[str] = (),
+    processed_keys: Sequence[str] = (),
+) -> list[tuple[str, list[str]]]:
+    """Drop references to stored objects; return the (bucket, keys) left unreferenced.
+
+    Pass the result to _delete_objects once the release is committed; see
+    crud.release_storage_refs.
+    """
+    raw_keys, processed_keys = list(raw_keys), list(processed_keys)
+    orphaned = await crud.release_storage_refs(db, raw_keys + processed_keys)
+    unreferenced = []
+    for bucket, keys in (
+        (settings.s3_bucket_raw, raw_keys),
+        (settings.s3_bucket_processed, processed_keys),
+    ):
+        # An edit saved with the upload's options shares its processed key
+        keys = [key for key in dict.fromkeys(keys) if key in orphaned]
+        if keys:
+            unreferenced.append((bucket, keys))
+    return unreferenced
+
+
+async def _delete_objects(unreferenced: list[tuple[str, list[str]]]) -> None:
+    # Raw and processed objects live in different buckets: one round-trip per bucket
+    await asyncio.gather(*(
+        run_in_threadpool(s3.delete_files_from_s3, bucket, keys) for bucket, keys in unreferenced
+    ))
+
+
+def _list_validator(images) -> bytes:
+    """ETag source for image lists: the rows behind the payload, not its signed URLs."""
+    return orjson.dumps([
+        s3.presign_window(),
+        [
+            (
+                image.id,
+                image.user_index,
+                image.filename,
+                image.s3_key_raw,
+                image.s3_url_processed,
+                image.s3_url_edited,
+                image.options,
+                image.is_favorite,
+                image.upload_date,
+            )
+            for image in images
+        ],
+    ])
 
 
 @router.post("/upload", response_model=ImageUploadResponse)
@@ -67,37 +137,21 @@ async def upload_image(
     saturation: int = Query(0, ge=-100, le=100),
     format: ImageFormat = Query(ImageFormat.JPEG),
     quality: int = Query(85, ge=1, le=100),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    if file.content_type not in ALLOWED_CONTENT_TYPES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_CONTENT_TYPES)}",
-        )
+    if file.content_type is None or file.content_type not in ALLOWED_CONTENT_TYPES:
+        raise HTTPException(status_code=400, detail=INVALID_CONTENT_TYPE_DETAIL)
 
-    content = await file.read()
-    if len(content) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File too large. Max 10MB.")
+    _check_upload_size(file)
 
     original_filename = file.filename or "unknown"
-    ext = Path(original_filename).suffix or ".jpg"
-    unique_id = uuid.uuid4().hex[:12]
-    raw_key = f"raw/{unique_id}{ext}"
-
-    success = s3.upload_file_to_s3(
-        content,
-        settings.s3_bucket_raw,
-        raw_key,
-        content_type=file.content_type or "image/jpeg",
-    )
-
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to upload image to storage")
-
-    image = crud.create_image(
-        db, filename=original_filename, s3_key_raw=raw_key, user_id=current_user.id
-    )
+    ext = splitext(original_filename)[1].rstrip(".") or ".jpg"
+    # Raw objects are named by owner and content, so a user's repeated upload
+    # reuses the stored original and, through process_image's key check, its
+    # processed output. Other users never share (or can probe for) them.
+    content_hash = await run_in_threadpool(_hash_upload, file.file)
+    raw_key = f"raw/{current_user.id}/{content_hash}{ext}"
 
     options = ImageProcessingOptions(
         width=width,
@@ -118,14 +172,67 @@ async def upload_image(
         format=format,
         quality=quality,
     )
+    options_dict = options.model_dump(mode="json")
+    processed_key = generate_processed_key(raw_key, options, options_dict)
+
+    # Claim both objects before looking for them, so deleting another image
+    # that uses them cannot remove them between the checks and the INSERT.
+    # Objects no image referenced yet are written without checking.
+    created = await crud.acquire_storage_refs(db, [raw_key, processed_key])
+
+    if raw_key in created or not await run_in_threadpool(
+        s3.file_exists_in_s3, settings.s3_bucket_raw, raw_key
+    ):
+        # Stream straight from the spooled upload instead of buffering it
+        await file.seek(0)
+        success = await run_in_threadpool(
+            s3.upload_file_to_s3_stream,
+            file.file,
+            settings.s3_bucket_raw,
+            raw_key,
+            content_type=file.content_type or "image/jpeg",
+        )
 
-    result = process_image(raw_key, options=options)
+        if not success:
+            unreferenced = await _release_objects(db, [raw_key], [processed_key])
+            await db.commit()
+            await _delete_objects(unreferenced)
+            raise HTTPException(status_code=500, detail="Failed to upload image to storage")
+
+    # Processing runs before the row is written, so the outcome is stored
+    # with a single INSERT. Pillow work runs in the threadpool so the event
+    # loop keeps serving other requests meanwhile.
+    result = await run_in_threadpool(
+        process_image,
+        raw_key,
+        options=options,
+        options_dict=options_dict,
+        processed_key=processed_key,
+        reuse_existing=processed_key not in created,
+    )
     if result:
         processed_key, processed_url = result
-        crud.update_image_processed(db, image.id, processed_url, options.model_dump())
+        image = await crud.create_image(
+            db,
+            filename=original_filename,
+            s3_key_raw=raw_key,
+            user_id=current_user.id,
+            status=ImageStatus.COMPLETED,
+            s3_url_processed=processed_url,
+            options=options_dict,
+        )
         url = processed_url
     else:
-        crud.update_image_failed(db, image.id)
+        # A failed row keeps only the raw object
+        unreferenced = await _release_objects(db, processed_keys=[processed_key])
+        image = await crud.create_image(
+            db,
+            filename=original_filename,
+            s3_key_raw=raw_key,
+            user_id=current_user.id,
+            status=ImageStatus.FAILED,
+        )
+        await _delete_objects(unreferenced)
         url = s3.generate_presigned_url(settings.s3_bucket_raw, raw_key)
 
     return ImageUploadResponse(
@@ -141,15 +248,15 @@ async def upload_image(
 async def reprocess_image(
     image_id: int,
     options: ImageProcessingOptions = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    image = crud.get_image(db, image_id, user_id=current_user.id)
+    image = await crud.get_image(db, image_id, user_id=current_user.id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
     # Preserve original format for edits
-    original_ext = Path(image.s3_key_raw).suffix.lower().lstrip(".")
+    original_ext = splitext(image.s3_key_raw)[1].lower().lstrip(".")
     format_mapping = {
         "jpg": ImageFormat.JPEG,
         "jpeg": ImageFormat.JPEG,
@@ -159,10 +266,27 @@ async def reprocess_image(
     if original_ext in format_mapping:
         options.format = format_mapping[original_ext]
 
-    result = process_image(image.s3_key_raw, options=options)
+    options_dict = options.model_dump(mode="json")
+    edited_key = generate_processed_key(image.s3_key_raw, options, options_dict)
+    created = await crud.acquire_storage_refs(db, [edited_key])
+    result = await run_in_threadpool(
+        process_image,
+        image.s3_key_raw,
+        options=options,
+        options_dict=options_dict,
+        processed_key=edited_key,
+        reuse_existing=edited_key not in created,
+    )
     if result:
-        edited_key, edited_url = result
-        crud.update_image_edited(db, image.id, edited_url, options.model_dump())
+        _, edited_url = result
+        # Each option set has its own key, so release the edit being replaced
+        unreferenced = []
+        if image.s3_url_edited:
+            unreferenced = await _release_objects(
+                db, processed_keys=[s3.extract_key(image.s3_url_edited)[1]]
+            )
+        await crud.update_image_edited(db, image.id, edited_url, options_dict)
+        await _delete_objects(unreferenced)
         return ImageUploadResponse(
             id=image.id,
             user_index=image.user_index,
@@ -173,52 +297,51 @@ async def reprocess_image(
             options_applied=options,
         )
 
+    unreferenced = await _release_objects(db, processed_keys=[edited_key])
+    await db.commit()
+    await _delete_objects(unreferenced)
     raise HTTPException(status_code=500, detail="Failed to process image")
 
 
 @router.get("/images", response_model=list[ImageResponse])
 async def get_images(
+    request: Request,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
-) -> list[ImageResponse]:
-    images = crud.get_images(db, user_id=current_user.id, skip=skip, limit=limit)
-    return [
-        ImageResponse.from_orm_with_url(
-            img,
-            img.s3_url_processed,
-            original_url=s3.generate_presigned_url(settings.s3_bucket_raw, img.s3_key_raw),
-        )
-        for img in images
-    ]
+) -> Response:
+    images = await crud.get_images(db, user_id=current_user.id, skip=skip, limit=limit)
+    original_urls = await s3.generate_presigned_urls_async(
+        settings.s3_bucket_raw, (img.s3_key_raw for img in images)
+    )
+    payload = ImageResponse.bulk_dump_from_orm(images, original_urls)
+    return conditional_json_response(request, orjson.dumps(payload), validator=_list_validator(images))
 
 
 @router.get("/images/favorites", response_model=list[ImageResponse])
 async def get_favorite_images(
+    request: Request,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
-) -> list[ImageResponse]:
-    images = crud.get_favorite_images(db, user_id=current_user.id, skip=skip, limit=limit)
-    return [
-        ImageResponse.from_orm_with_url(
-            img,
-            img.s3_url_processed,
-            original_url=s3.generate_presigned_url(settings.s3_bucket_raw, img.s3_key_raw),
-        )
-        for img in images
-    ]
+) -> Response:
+    images = await crud.get_favorite_images(db, user_id=current_user.id, skip=skip, limit=limit)
+    original_urls = await s3.generate_presigned_urls_async(
+        settings.s3_bucket_raw, (img.s3_key_raw for img in images)
+    )
+    payload = ImageResponse.bulk_dump_from_orm(images, original_urls)
+    return conditional_json_response(request, orjson.dumps(payload), validator=_list_validator(images))
 
 
 @router.patch("/images/{image_id}/favorite", response_model=ImageResponse)
 async def toggle_favorite(
     image_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    image = crud.toggle_favorite(db, image_id, user_id=current_user.id)
+    image = await crud.toggle_favorite(db, image_id, user_id=current_user.id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
@@ -232,10 +355,10 @@ async def toggle_favorite(
 @router.get("/images/{image_id}", response_model=ImageResponse)
 async def get_image(
     image_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    image = crud.get_image(db, image_id, user_id=current_user.id)
+    image = await crud.get_image(db, image_id, user_id=current_user.id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
@@ -249,35 +372,36 @@ async def get_image(
 @router.post("/images/{image_id}/revert", response_model=ImageResponse)
 async def revert_image(
     image_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Revert an image to its original state, removing edits and edited share links."""
-    image = crud.get_image(db, image_id, user_id=current_user.id)
+    image = await crud.get_image(db, image_id, user_id=current_user.id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
     if not image.s3_url_edited:
         raise HTTPException(status_code=400, detail="Image has no edits to revert")
 
-    # Delete the edited image file from S3
-    if image.s3_url_edited:
-        edited_key = _extract_processed_key(image.s3_url_edited)
-        if edited_key:
-            s3.delete_file_from_s3(settings.s3_bucket_processed, edited_key)
-            logger.info(f"Deleted edited image from S3: {edited_key}")
-
-    # Delete share links that reference the edited version
-    deleted_links = crud.delete_edited_share_links(db, image_id, current_user.id)
-    logger.info(f"Deleted {deleted_links} edited share links for image {image_id}")
+    # Release the edited image file. Keys are derived from the source content
+    # and options, so the upload itself or another image with the same source
+    # may share the object; it is deleted once nothing references it, after
+    # the release commits together with the cleared URL.
+    _, edited_key = s3.extract_key(image.s3_url_edited)
+    unreferenced = await _release_objects(db, processed_keys=[edited_key]) if edited_key else []
 
     # Clear the edited URL in database
     try:
-        updated_image = crud.revert_image_edit(db, image_id, current_user.id)
+        updated_image = await crud.revert_image_edit(db, image_id, current_user.id)
     except ImageNotFoundError:
         raise HTTPException(status_code=404, detail="Image not found")
     except NoEditToRevertError:
         raise HTTPException(status_code=400, detail="Image has no edits to revert")
+    await _delete_objects(unreferenced)
+
+    # Delete share links that reference the edited version
+    deleted_links = await crud.delete_edited_share_links(db, image_id, current_user.id)
+    logger.info(f"Deleted {deleted_links} edited share links for image {image_id}")
 
     return ImageResponse.from_orm_with_url(
         updated_image,
@@ -289,23 +413,23 @@ async def revert_image(
 @router.delete("/images/{image_id}")
 async def delete_image(
     image_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    image = crud.get_image(db, image_id, user_id=current_user.id)
+    image = await crud.get_image(db, image_id, user_id=current_user.id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
-    if image.s3_key_raw:
-        s3.delete_file_from_s3(settings.s3_bucket_raw, image.s3_key_raw)
-    if image.s3_url_processed:
-        processed_key = _extract_processed_key(image.s3_url_processed)
-        s3.delete_file_from_s3(settings.s3_bucket_processed, processed_key)
-    if image.s3_url_edited:
-        edited_key = _extract_processed_key(image.s3_url_edited)
-        s3.delete_file_from_s3(settings.s3_bucket_processed, edited_key)
+    # Identical uploads share content-addressed objects; only those left
+    # unreferenced are deleted, once the row delete has committed the counts
+    unreferenced = await _release_objects(
+        db,
+        [image.s3_key_raw] if image.s3_key_raw else [],
+        [s3.extract_key(url)[1] for url in (image.s3_url_processed, image.s3_url_edited) if url],
+    )
+    await crud.delete_image(db, image_id, user_id=current_user.id)
+    await _delete_objects(unreferenced)
 
-    crud.delete_image(db, image_id, user_id=current_user.id)
     return {"message": "Image deleted", "id": image_id}
 
 
@@ -313,10 +437,10 @@ async def delete_image(
 async def download_image(
     image_id: int,
     version: str = Query("original", pattern="^(original|edited)$"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 ):
-    image = crud.get_image(db, image_id, user_id=current_user.id)
+    image = await crud.get_image(db, image_id, user_id=current_user.id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
@@ -325,9 +449,9 @@ async def download_image(
 
     if version == "edited" and image.s3_url_edited:
         # Download edited version (separate from display webp)
-        edited_key = _extract_processed_key(image.s3_url_edited)
-        filename_base = Path(image.filename).stem
-        filename_ext = Path(edited_key).suffix or ".jpg"
+        _, edited_key = s3.extract_key(image.s3_url_edited)
+        filename_base = splitext(basename(image.filename))[0]
+        filename_ext = splitext(edited_key)[1].rstrip(".") or ".jpg"
         download_filename = f"{filename_base}_edited{filename_ext}"
 
         if settings.use_local_storage:
@@ -1,7 +1,11 @@
 """Share link router for public image sharing."""
 
+import asyncio
+
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud
 from ..config import get_settings
@@ -10,28 +14,31 @@ from ..logging_config import get_logger
 from ..models import User
 from ..schemas import ShareDuration, ShareLinkCreate, ShareLinkResponse, SharedImageResponse, ShareLinkListItem
 from ..services.auth import get_current_user
+from ..services.http_cache import conditional_json_response
 from ..services import s3
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/api", tags=["Share"])
 settings = get_settings()
 
+SHARE_LIST_ADAPTER = TypeAdapter(list[ShareLinkListItem])
+
 
 @router.post("/share", response_model=ShareLinkResponse)
-def create_share_link(
+async def create_share_link(
     data: ShareLinkCreate,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Create a shareable link for an image."""
     # Verify user owns the image
-    image = crud.get_image(db, data.image_id, current_user.id)
+    image = await crud.get_image(db, data.image_id, current_user.id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
     # Create share link with version
-    share_link = crud.create_share_link(db, data.image_id, data.duration.value, data.version.value)
+    share_link = await crud.create_share_link(db, data.image_id, data.duration.value, data.version.value)
 
     # Build share URL
     base_url = str(request.base_url).rstrip("/")
@@ -45,71 +52,102 @@ def create_share_link(
 
 
 @router.get("/share/list", response_model=list[ShareLinkListItem])
-def list_share_links(
+async def list_share_links(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get all share links for the current user."""
-    share_links = crud.get_share_links_by_user(db, current_user.id)
-    base_url = str(request.base_url).rstrip("/")
-    
+    share_links = await crud.get_share_links_by_user(db, current_user.id)
+    share_prefix = str(request.base_url).rstrip("/") + "/api/s/"
+    # Settings are constant for the whole loop; bind them once
+    use_local_storage = settings.use_local_storage
+    bucket_processed = settings.s3_bucket_processed
+    bucket_raw = settings.s3_bucket_raw
+
+    # Resolve each thumbnail's (bucket, key) first so all URLs can be signed
+    # in one batch per bucket, off the event loop
+    sources: list[tuple[str, str]] = []
+    keys_by_bucket: dict[str, list[str]] = {}
+    if not use_local_storage:
+        for link in share_links:
+            image = link.image
+            # For S3, extract just the key from the full URL
+            if image.s3_url_processed:
+                logger.debug("[list_share_links] Processing s3_url_processed: %s", image.s3_url_processed)
+                _, s3_key = s3.extract_key(image.s3_url_processed)
+                bucket = bucket_processed
+            else:
+                s3_key = image.s3_key_raw
+                bucket = bucket_raw
+            logger.debug("[list_share_links] Extracted S3 key: %s, bucket: %s", s3_key, bucket)
+            sources.append((bucket, s3_key))
+            keys_by_bucket.setdefault(bucket, []).append(s3_key)
+
+    # Several links often point at the same image; each object is signed once
+    signed = await asyncio.gather(*(
+        s3.generate_presigned_urls_async(bucket, keys)
+        for bucket, keys in keys_by_bucket.items()
+    ))
+    presigned = dict(zip(keys_by_bucket, signed))
+
     result = []
-    for link in share_links:
+    for i, link in enumerate(share_links):
         image = link.image
         # Get image URL for thumbnail
-        if settings.use_local_storage:
+        if use_local_storage:
             image_url = image.s3_url_processed or f"/uploads/{image.s3_key_raw}"
         else:
-            # For S3, extract just the key from the full URL
-            if image.s3_url_processed:
-                s3_url = image.s3_url_processed
-                logger.debug(f"[list_share_links] Processing s3_url_processed: {s3_url}")
-                if s3_url.startswith("https://"):
-                    parts = s3_url.split(".amazonaws.com/", 1)
-                    s3_key = parts[1] if len(parts) == 2 else s3_url.split("/", 3)[-1]
-                else:
-                    s3_key = s3_url
-                bucket = settings.s3_bucket_processed
-            else:
-                s3_key = image.s3_key_raw
-                bucket = settings.s3_bucket_raw
-            
-            logger.debug(f"[list_share_links] Extracted S3 key: {s3_key}, bucket: {bucket}")
-            
-            image_url = s3.generate_presigned_url(
-                bucket,
-                s3_key,
-                expiration=3600,
-            )
-            logger.debug(f"[list_share_links] Generated presigned URL: {image_url[:100] if image_url else 'None'}...")
-        
+            bucket, s3_key = sources[i]
+            image_url = presigned[bucket][s3_key]
+            logger.debug("[list_share_links] Generated presigned URL: %.100s...", image_url)
+
         result.append(ShareLinkListItem(
             share_id=link.id,
             image_id=image.id,
             image_filename=image.filename,
             image_url=image_url,
-            share_url=f"{base_url}/api/s/{link.id}",
+            share_url=share_prefix + link.id,
             version=link.version or "edited",
             expires_at=link.expires_at,
             created_at=link.created_at,
             is_expired=link.is_expired(),
         ))
     
-    return result
+    # Tag the rows behind the list rather than its signed thumbnail URLs
+    validator = orjson.dumps([
+        s3.presign_window(),
+        share_prefix,
+        [
+            (
+                link.id,
+                link.version,
+                link.expires_at,
+                link.created_at,
+                item.is_expired,
+                link.image.id,
+                link.image.filename,
+                link.image.s3_url_processed,
+                link.image.s3_key_raw,
+            )
+            for link, item in zip(share_links, result)
+        ],
+    ])
+    return conditional_json_response(request, SHARE_LIST_ADAPTER.dump_json(result), validator=validator)
 
 
 @router.get("/s/{share_id}", response_model=SharedImageResponse)
-def get_shared_image(
+async def get_shared_image(
     share_id: str,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Public endpoint to access a shared image.
     No authentication required.
     """
     logger.debug(f"[get_shared_image] Fetching share link: {share_id}")
-    share_link = crud.get_share_link(db, share_id)
+    share_link = await crud.get_share_link(db, share_id)
 
     if not share_link:
         logger.debug(f"[get_shared_image] Share link not found: {share_id}")
@@ -147,21 +185,13 @@ def get_shared_image(
             # Use edited version (full quality edits)
             s3_url = image.s3_url_edited
             logger.debug(f"[get_shared_image] Using edited version: {s3_url}")
-            if s3_url.startswith("https://"):
-                parts = s3_url.split(".amazonaws.com/", 1)
-                s3_key = parts[1] if len(parts) == 2 else s3_url.split("/", 3)[-1]
-            else:
-                s3_key = s3_url
+            _, s3_key = s3.extract_key(s3_url)
             bucket = settings.s3_bucket_processed
         elif use_edited and image.s3_url_processed:
             # Fallback to display version if no edited version
             s3_url = image.s3_url_processed
             logger.debug(f"[get_shared_image] Using processed version: {s3_url}")
-            if s3_url.startswith("https://"):
-                parts = s3_url.split(".amazonaws.com/", 1)
-                s3_key = parts[1] if len(parts) == 2 else s3_url.split("/", 3)[-1]
-            else:
-                s3_key = s3_url
+            _, s3_key = s3.extract_key(s3_url)
             bucket = settings.s3_bucket_processed
         else:
             # Use original version
@@ -184,21 +214,31 @@ def get_shared_image(
         
         logger.debug(f"[get_shared_image] Generated presigned URL successfully (length={len(image_url)})")
 
-    return SharedImageResponse(
+    shared = SharedImageResponse(
         image_url=image_url,
         filename=image.filename,
         expires_at=share_link.expires_at,
     )
+    # Share pages are polled; let clients revalidate instead of re-downloading.
+    # The tag follows the chosen object, not its freshly signed URL.
+    return conditional_json_response(
+        request,
+        shared.model_dump_json().encode(),
+        last_modified=max(share_link.created_at, image.upload_date),
+        validator=orjson.dumps(
+            [s3.presign_window(), s3_key, image.filename, share_link.expires_at]
+        ),
+    )
 
 
 @router.delete("/share/{share_id}")
-def delete_share_link(
+async def delete_share_link(
     share_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Delete/revoke a share link. Only the owner can delete."""
-    success = crud.delete_share_link(db, share_id, current_user.id)
+    success = await crud.delete_share_link(db, share_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Share link not found")
     return {"message": "Share link deleted"}
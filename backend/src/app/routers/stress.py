@@ -1,19 +1,30 @@
 import time
 
+import numpy as np
 from fastapi import APIRouter
 
 from ..schemas import StressResponse
 
 router = APIRouter(prefix="/api", tags=["Stress Test"])
 
+# Work vector for the burn kernel, allocated once at import
+_BURN_VECTOR = np.arange(10000, dtype=np.int64)
 
+
+def _burn(seconds: int) -> None:
+    """Keep one core busy for ``seconds`` with a vectorized sum of squares."""
+    end_time = time.monotonic() + seconds
+    while time.monotonic() < end_time:
+        _ = int(np.dot(_BURN_VECTOR, _BURN_VECTOR))
+
+
+# Declared sync so Starlette runs it in the threadpool instead of blocking
+# the event loop for the whole duration of the test
 @router.get("/stress/{seconds}", response_model=StressResponse)
-async def stress_test(seconds: int) -> StressResponse:
+def stress_test(seconds: int) -> StressResponse:
     seconds = min(seconds, 60)
 
-    end_time = time.time() + seconds
-    while time.time() < end_time:
-        _ = sum(i * i for i in range(10000))
+    _burn(seconds)
 
     return StressResponse(
         message=f"CPU stress test completed for {seconds} seconds",
@@ -86,6 +86,38 @@ class ImageResponse(BaseModel):
             is_favorite=image.is_favorite,
         )
 
+    @classmethod
+    def bulk_dump_from_orm(cls, images, original_urls: dict[str, str | None]) -> list[dict]:
+        """Build the JSON-ready form of many responses without per-row validation.
+
+        Rows come from our own database, whose stored options were produced by
+        a validated ``ImageProcessingOptions``; they are only projected onto
+        the declared fields, with defaults for any an older row lacks. Plain
+        dicts are used because ``model_construct`` is slower than validating
+        in pydantic v2.
+        """
+        defaults = _DEFAULT_OPTIONS
+        return [
+            {
+                "id": image.id,
+                "user_index": image.user_index,
+                "filename": image.filename,
+                "url": image.s3_url_processed,
+                "original_url": original_urls[image.s3_key_raw],
+                "edited_url": image.s3_url_edited,
+                "options": (
+                    {key: image.options.get(key, default) for key, default in defaults.items()}
+                    if image.options else None
+                ),
+                "uploaded_at": image.upload_date,
+                "is_favorite": image.is_favorite,
+            }
+            for image in images
+        ]
+
+
+_DEFAULT_OPTIONS = ImageProcessingOptions().model_dump(mode="json")
+
 
 class ImageUploadResponse(BaseModel):
     id: int
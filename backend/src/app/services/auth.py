@@ -1,11 +1,18 @@
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import hashlib
+import hmac
+import threading
 
 import bcrypt
+import jwt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status, Query
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import get_settings
 from ..database import get_db
@@ -17,31 +24,83 @@ logger = get_logger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# OWASP baseline parameters: 2 passes over 19 MiB, single lane
+_argon2 = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# One decoder with fixed options; tokens without "exp" or "sub" are rejected
+_jwt = jwt.PyJWT(options={"require": ["exp", "sub"]})
+_JWT_ALGORITHMS = [settings.jwt_algorithm]
+
+# Recent successful verifications, keyed by (HMAC of the password, stored hash)
+# so no plaintext is kept and a changed hash never hits. Failures are not cached.
+_verified_passwords: TTLCache = TTLCache(maxsize=2048, ttl=300)
+_verified_passwords_lock = threading.Lock()
+
+# Users resolved from recent tokens, detached from their session; routes only
+# read column attributes, and the short TTL bounds how stale is_active can be
+_users_by_username: TTLCache = TTLCache(maxsize=4096, ttl=30)
+
+# SHA256 state after the "{pepper}:" prefix; each lookup only hashes the username
+_username_hash_prefix = hashlib.sha256(f"{settings.jwt_secret_key}:".encode("utf-8"))
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash."""
+    """Verify a password against its hash, skipping bcrypt for recent successes."""
     password_bytes = plain_password.encode("utf-8")
-    hash_bytes = hashed_password.encode("utf-8")
-    return bcrypt.checkpw(password_bytes, hash_bytes)
+    cache_key = (
+        hmac.new(settings.jwt_secret_key.encode("utf-8"), password_bytes, hashlib.sha256).digest(),
+        hashed_password,
+    )
+    with _verified_passwords_lock:
+        if cache_key in _verified_passwords:
+            return True
+
+    if not _check_password(password_bytes, hashed_password):
+        return False
+
+    with _verified_passwords_lock:
+        _verified_passwords[cache_key] = True
+    return True
+
+
+def _check_password(password_bytes: bytes, hashed_password: str) -> bool:
+    if hashed_password.startswith("$argon2"):
+        try:
+            return _argon2.verify(hashed_password, password_bytes)
+        except (VerificationError, InvalidHashError):
+            return False
+    return bcrypt.checkpw(password_bytes, hashed_password.encode("utf-8"))
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash predates the configured hasher or its parameters."""
+    if settings.password_hasher != "argon2":
+        return False
+    return not hashed_password.startswith("$argon2") or _argon2.check_needs_rehash(hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """Hash a password using bcrypt."""
+    """Hash a password with the configured hasher (bcrypt or Argon2id)."""
+    if settings.password_hasher == "argon2":
+        return _argon2.hash(password)
+
     password_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.bcrypt_rounds)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode("utf-8")
 
 
+@lru_cache(maxsize=4096)
 def hash_username(username: str) -> str:
     """
     Create a deterministic hash of username for database lookup.
     Uses SHA256 which is deterministic (same input = same output).
     This allows us to query the database without storing plaintext usernames.
     """
-    # Add a pepper for additional security (from settings)
-    peppered = f"{settings.jwt_secret_key}:{username.lower()}"
-    return hashlib.sha256(peppered.encode("utf-8")).hexdigest()
+    # Same digest as sha256(f"{pepper}:{username.lower()}"), so stored hashes stay valid
+    digest = _username_hash_prefix.copy()
+    digest.update(username.lower().encode("utf-8"))
+    return digest.hexdigest()
 
 
 def get_username_display(username: str) -> str:
@@ -67,62 +126,75 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     return encoded_jwt
 
 
-def _decode_and_get_user(token: str, db: Session, return_display_name: bool = False) -> User | tuple[User, str | None]:
-    """Shared helper to decode JWT token and retrieve user.
-    
-    If return_display_name is True, returns (user, display_name) tuple.
-    Otherwise, returns just the user.
-    """
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode_token(token: str) -> dict:
+    """Verify the token and return its claims; "sub" is guaranteed present."""
     try:
-        payload = jwt.decode(
-            token,
-            settings.jwt_secret_key,
-            algorithms=[settings.jwt_algorithm]
-        )
-        username: str | None = payload.get("sub")
-        display_name: str | None = payload.get("display_name")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    user = db.query(User).filter(User.username == username).first()
+        return _jwt.decode(token, settings.jwt_secret_key, algorithms=_JWT_ALGORITHMS)
+    except jwt.InvalidTokenError:
+        raise _credentials_exception()
+
+
+async def _get_active_user(username: str, db: AsyncSession) -> User:
+    user = _users_by_username.get(username)
     if user is None:
-        raise credentials_exception
+        user = await db.scalar(select(User).where(User.username == username))
+        if user is None:
+            raise _credentials_exception()
+        db.expunge(user)
+        _users_by_username[username] = user
     if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
         )
-    
-    if return_display_name:
-        return user, display_name
     return user
 
 
-def get_current_user(
+async def _decode_user(token: str, db: AsyncSession) -> User:
+    return await _get_active_user(_decode_token(token)["sub"], db)
+
+
+async def _decode_user_with_display(token: str, db: AsyncSession) -> tuple[User, str | None]:
+    payload = _decode_token(token)
+    return await _get_active_user(payload["sub"], db), payload.get("display_name")
+
+
+def clear_user_cache() -> None:
+    """Forget every cached token user, e.g. after users were changed or removed."""
+    _users_by_username.clear()
+
+
+def evict_cached_user(username: str) -> None:
+    """Forget one cached token user (by stored, hashed username) after a write."""
+    _users_by_username.pop(username, None)
+
+
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> User:
-    return _decode_and_get_user(token, db)
+    return await _decode_user(token, db)
 
 
-def get_current_user_with_display_name(
+async def get_current_user_with_display_name(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> tuple[User, str | None]:
     """Get current user along with their display name from the JWT token."""
-    return _decode_and_get_user(token, db, return_display_name=True)
+    return await _decode_user_with_display(token, db)
 
 
-def get_current_user_from_token(
+async def get_current_user_from_token(
     token: str = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> User:
-    return _decode_and_get_user(token, db)
+    return await _decode_user(token, db)
 
@@ -0,0 +1,48 @@
+"""Conditional GET support for JSON endpoints."""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from fastapi import Request, Response
+
+# Responses are per-user and contain short-lived presigned URLs, so clients
+# may keep them but must revalidate before every reuse
+DEFAULT_CACHE_CONTROL = "private, no-cache"
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" name the same representation
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def conditional_json_response(
+    request: Request,
+    body: bytes,
+    last_modified: datetime | None = None,
+    cache_control: str = DEFAULT_CACHE_CONTROL,
+    validator: bytes | None = None,
+) -> Response:
+    """Return ``body`` as JSON with an ETag, or a bodyless 304 if the client has it.
+
+    The ETag is derived from ``validator``, or from the serialized body when
+    none is given. Bodies carrying presigned URLs differ on every signing, so
+    their callers pass the state the body was built from instead (see
+    s3.presign_window). ``last_modified`` is sent as a hint only;
+    revalidation relies on the ETag.
+    """
+    tagged = body if validator is None else validator
+    etag = f'"{hashlib.blake2b(tagged, digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,64 +1,140 @@
+import hashlib
 import io
-from pathlib import Path
-
+import math
+import os
+import threading
+
+import numba
+import numpy as np
+import orjson
+from cykooz_resizer import FilterType as ResizeFilter
+from cykooz_resizer import ResizeAlg, ResizeOptions, Resizer
+from numba import njit, prange
 from PIL import Image as PILImage
-from PIL import ImageEnhance, ImageFilter, ImageOps
+from PIL import ImageFilter, ImageOps
 
 from ..config import get_settings
 from ..logging_config import get_logger
 from ..schemas import FilterType, ImageFormat, ImageProcessingOptions
-from .s3 import download_file_from_s3, get_public_url, upload_file_to_s3
+from .s3 import download_stream_from_s3, file_exists_in_s3, get_public_url, upload_file_to_s3
 
 logger = get_logger(__name__)
 settings = get_settings()
 
+# The vips extra is optional. Check it when the app starts: process_image
+# catches every error, so a missing module would otherwise just leave each
+# upload unprocessed.
+if settings.image_backend == "vips":
+    try:
+        import pyvips
+    except (ImportError, OSError) as e:
+        raise RuntimeError(
+            "IMAGE_BACKEND=vips requires the vips extra (uv sync --extra vips)"
+        ) from e
+
 PRESET_SIZES = {
     "thumbnail": (150, 150),
     "medium": (800, 800),
     "large": (1920, 1920),
 }
 
+# SIMD Lanczos3; the resizer picks the best CPU extensions (AVX2/NEON) itself
+_RESIZER = Resizer()
+_LANCZOS3 = ResizeOptions(resize_alg=ResizeAlg.convolution(ResizeFilter.lanczos3))
+# Modes resize_pil handles without a conversion; the rest (P, LA, ...) use Pillow
+_RESIZER_MODES = frozenset({"RGB", "RGBA", "L"})
+
+# Sepia coefficients in 8.8 fixed point (round(coeff * 256)), one row per output channel
+SEPIA_I16 = np.array([
+    [101, 197, 48],
+    [89, 176, 43],
+    [70, 137, 34],
+], dtype=np.int16)
+# The kernel already spreads one image over every core, and Numba's default
+# threading layer aborts on concurrent launches from several threads
+_COLOR_LOCK = threading.Lock()
+# TBB, which Numba prefers when installed, hangs interpreter exit once the
+# kernel has run off the main thread; launches are serialised above anyway
+if "NUMBA_THREADING_LAYER" not in os.environ:
+    numba.config.THREADING_LAYER = "workqueue"
+
+# Filter objects hold no per-image state, so one instance serves every request
+_GAUSSIAN_BLUR = ImageFilter.GaussianBlur(radius=2)
+_SHARPEN = ImageFilter.SHARPEN()
+_CONTOUR = ImageFilter.CONTOUR()
+_EMBOSS = ImageFilter.EMBOSS()
+
+# 8-bit modes handed to libvips as plain band-interleaved memory
+_VIPS_MODES = frozenset({"RGB", "RGBA", "L"})
+
 
 def process_image(
     raw_key: str,
     options: ImageProcessingOptions | None = None,
     size: str | None = None,
+    options_dict: dict | None = None,
+    processed_key: str | None = None,
+    reuse_existing: bool = True,
 ) -> tuple[str, str] | None:
+    """Process a raw image and store the result.
+
+    Callers that also persist the options pass their ``model_dump`` as
+    ``options_dict`` so the model is only serialized once per request, and
+    ``processed_key`` if they already derived it with generate_processed_key.
+    With ``reuse_existing`` false the result is written even if the key
+    already holds an object.
+    """
     if options is None:
         options = ImageProcessingOptions()
         if size:
             options.preset = size
-
-    raw_content = download_file_from_s3(settings.s3_bucket_raw, raw_key)
-    if not raw_content:
+    if options_dict is None:
+        options_dict = options.model_dump(mode="json")
+
+    # Output keys are derived from (raw_key, options), so an identical request
+    # can reuse the stored result without downloading or decoding anything
+    if processed_key is None:
+        processed_key = generate_processed_key(raw_key, options, options_dict)
+    if reuse_existing and file_exists_in_s3(settings.s3_bucket_processed, processed_key):
+        logger.info(f"Reusing processed image {processed_key}")
+        return processed_key, get_public_url(settings.s3_bucket_processed, processed_key)
+
+    raw_stream = download_stream_from_s3(settings.s3_bucket_raw, raw_key)
+    if raw_stream is None:
         logger.error(f"Failed to download raw image: {raw_key}")
         return None
 
     try:
-        img = PILImage.open(io.BytesIO(raw_content))
-
-        if img.mode in ("RGBA", "P") and options.format == ImageFormat.JPEG:
-            img = img.convert("RGB")
+        # Decode from the stream, then drop it so the encoded bytes are not
+        # held for the rest of the pipeline
+        with raw_stream:
+            img = PILImage.open(raw_stream)
+            draft_size = _draft_size(img, options)
+            if draft_size:
+                # Let libjpeg downscale in the DCT domain, keeping 2x headroom
+                # for the Lanczos pass (the same gap Image.thumbnail uses)
+                img.draft(None, (draft_size[0] * 2, draft_size[1] * 2))
+            img.load()
+
+        if img.mode == "P" and options.format == ImageFormat.JPEG:
+            img = img.convert("RGBA" if img.has_transparency_data else "RGB")
         elif img.mode != "RGBA" and options.format == ImageFormat.PNG:
             img = img.convert("RGBA")
 
         img = _apply_crop(img, options)
         img = _apply_resize(img, options)
+        if img.mode == "RGBA" and options.format == ImageFormat.JPEG:
+            # JPEG has no alpha. Flattening after the resize (which weights
+            # colours by alpha) touches the output size, not the source size.
+            img = _flatten_alpha(img)
         img = _apply_transformations(img, options)
         img = _apply_filters(img, options)
-        img = _apply_adjustments(img, options)
-
-        output_buffer = io.BytesIO()
-        save_format = options.format.value.upper()
-        if save_format == "JPEG":
-            img.save(output_buffer, format="JPEG", quality=options.quality, optimize=True, progressive=True)
-        elif save_format == "PNG":
-            img.save(output_buffer, format="PNG", optimize=True)
-        elif save_format == "WEBP":
-            img.save(output_buffer, format="WEBP", quality=options.quality)
+        img = _apply_color(img, options)
 
-        processed_content = output_buffer.getvalue()
-        processed_key = _generate_processed_key(raw_key, options)
+        if settings.image_backend == "vips" and img.mode in _VIPS_MODES:
+            processed_content = _encode_vips(img, options)
+        else:
+            processed_content = _encode_pillow(img, options)
 
         success = upload_file_to_s3(
             processed_content,
@@ -78,6 +154,24 @@ def process_image(
         return None
 
 
+def _draft_size(img: PILImage.Image, options: ImageProcessingOptions) -> tuple[int, int] | None:
+    """Smallest size the resize step needs from the decoder, if it can be known upfront.
+
+    Only JPEG decoders act on it; ``Image.draft`` is a no-op for other formats.
+    """
+    if all(v is not None for v in [options.crop_x, options.crop_y, options.crop_width, options.crop_height]):
+        # Crop coordinates refer to full-resolution pixels
+        return None
+    if options.preset and options.preset in PRESET_SIZES:
+        return PRESET_SIZES[options.preset]
+    if not (options.width or options.height):
+        return None
+    if options.maintain_aspect:
+        # A missing side follows the aspect ratio, so only the given one constrains
+        return options.width or 1, options.height or 1
+    return options.width or img.width, options.height or img.height
+
+
 def _apply_crop(img: PILImage.Image, options: ImageProcessingOptions) -> PILImage.Image:
     if all(v is not None for v in [options.crop_x, options.crop_y, options.crop_width, options.crop_height]):
         left = options.crop_x
@@ -108,17 +202,53 @@ def _apply_resize(img: PILImage.Image, options: ImageProcessingOptions) -> PILIm
         else:
             w = options.width or img.width
             h = options.height or img.height
-            return img.resize((w, h), PILImage.Resampling.LANCZOS)
+            return _resize_lanczos(img, (w, h))
 
     if target_size:
         if options.maintain_aspect or options.preset:
-            img.thumbnail(target_size, PILImage.Resampling.LANCZOS)
+            fitted = _fit_size(img.size, target_size)
+            if fitted:
+                img = _resize_lanczos(img, fitted)
         else:
-            img = img.resize(target_size, PILImage.Resampling.LANCZOS)
+            img = _resize_lanczos(img, target_size)
 
     return img
 
 
+def _fit_size(size: tuple[int, int], box: tuple[int, int]) -> tuple[int, int] | None:
+    """Size ``Image.thumbnail`` would shrink to, or None if it already fits."""
+    width, height = size
+    x, y = box
+    if x >= width and y >= height:
+        return None
+
+    def round_aspect(number: float, key) -> int:
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+def _resize_lanczos(img: PILImage.Image, size: tuple[int, int]) -> PILImage.Image:
+    if img.mode not in _RESIZER_MODES:
+        return img.resize(size, PILImage.Resampling.LANCZOS)
+
+    # resize_pil premultiplies alpha itself for RGBA sources
+    dst = PILImage.new(img.mode, size)
+    _RESIZER.resize_pil(img, dst, _LANCZOS3)
+    return dst
+
+
+def _flatten_alpha(img: PILImage.Image) -> PILImage.Image:
+    background = PILImage.new("RGB", img.size, (255, 255, 255))
+    background.paste(img, mask=img.getchannel("A"))
+    return background
+
+
 def _apply_transformations(img: PILImage.Image, options: ImageProcessingOptions) -> PILImage.Image:
     if options.rotate:
         img = img.rotate(-options.rotate, expand=True, resample=PILImage.Resampling.BICUBIC)
@@ -137,64 +267,165 @@ def _apply_filters(img: PILImage.Image, options: ImageProcessingOptions) -> PILI
         img = ImageOps.grayscale(img)
         if options.format != ImageFormat.PNG:
             img = img.convert("RGB")
-    elif options.filter == FilterType.SEPIA:
-        img = _apply_sepia(img)
+    # Sepia is applied together with the colour adjustments in _apply_color
     elif options.filter == FilterType.BLUR:
-        img = img.filter(ImageFilter.GaussianBlur(radius=2))
+        img = img.filter(_GAUSSIAN_BLUR)
     elif options.filter == FilterType.SHARPEN:
-        img = img.filter(ImageFilter.SHARPEN)
+        img = img.filter(_SHARPEN)
     elif options.filter == FilterType.CONTOUR:
-        img = img.filter(ImageFilter.CONTOUR)
+        img = img.filter(_CONTOUR)
     elif options.filter == FilterType.EMBOSS:
-        img = img.filter(ImageFilter.EMBOSS)
+        img = img.filter(_EMBOSS)
 
     return img
 
 
-def _apply_sepia(img: PILImage.Image) -> PILImage.Image:
-    import numpy as np
-
-    if img.mode != "RGB":
-        img = img.convert("RGB")
-
-    arr = np.array(img, dtype=np.float32)
-    sepia_matrix = np.array([
-        [0.393, 0.769, 0.189],
-        [0.349, 0.686, 0.168],
-        [0.272, 0.534, 0.131],
-    ])
-    sepia = arr @ sepia_matrix.T
-    sepia = np.clip(sepia, 0, 255).astype(np.uint8)
-    return PILImage.fromarray(sepia)
-
+def _apply_color(img: PILImage.Image, options: ImageProcessingOptions) -> PILImage.Image:
+    """Apply sepia and brightness/contrast/saturation in one pass over the pixels."""
+    sepia = options.filter == FilterType.SEPIA
+    brightness = 1 + (options.brightness / 100)
+    contrast = 1 + (options.contrast / 100)
+    saturation = 1 + (options.saturation / 100)
+    if not sepia and brightness == contrast == saturation == 1:
+        # Nothing to do, so grayscale output stays single-channel
+        return img
 
-def _apply_adjustments(img: PILImage.Image, options: ImageProcessingOptions) -> PILImage.Image:
-    if img.mode == "L":
+    if sepia and img.mode != "RGB":
         img = img.convert("RGB")
-
-    if options.brightness != 0:
-        factor = 1 + (options.brightness / 100)
-        enhancer = ImageEnhance.Brightness(img)
-        img = enhancer.enhance(factor)
-
-    if options.contrast != 0:
-        factor = 1 + (options.contrast / 100)
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(factor)
-
-    if options.saturation != 0:
-        factor = 1 + (options.saturation / 100)
-        enhancer = ImageEnhance.Color(img)
-        img = enhancer.enhance(factor)
-
-    return img
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+
+    arr = np.array(img)
+    with _COLOR_LOCK:
+        _fused_color(arr, sepia, SEPIA_I16, np.float32(brightness), np.float32(contrast), np.float32(saturation))
+    return PILImage.fromarray(arr)
+
+
+@njit(cache=True)
+def _luma(r, g, b):
+    # Same integer weights as Pillow's RGB -> L conversion
+    return (r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16
+
+
+@njit(cache=True)
+def _blend(base, value, factor):
+    # Image.blend(base, value, factor), truncated and clamped to uint8 like Pillow
+    t = np.float32(base) + factor * np.float32(value - base)
+    if t <= 0:
+        return 0
+    if t >= 255:
+        return 255
+    return np.int32(t)
+
+
+@njit(parallel=True, cache=True)
+def _fused_color(arr, sepia, matrix, brightness, contrast, saturation):
+    """Colour pipeline over an HxWxC uint8 array, in place; channel 3 (alpha) is kept.
+
+    Each stage matches the Pillow operation it replaces, including clamping
+    between stages. Contrast blends toward the mean luma of the image, so it
+    needs a second pass once the first has produced that mean.
+    """
+    height, width = arr.shape[0], arr.shape[1]
+    two_pass = contrast != 1
+    row_luma = np.zeros(height, dtype=np.int64)
+
+    for y in prange(height):
+        total = 0
+        for x in range(width):
+            r = np.int32(arr[y, x, 0])
+            g = np.int32(arr[y, x, 1])
+            b = np.int32(arr[y, x, 2])
+            if sepia:
+                nr = min((r * matrix[0, 0] + g * matrix[0, 1] + b * matrix[0, 2]) >> 8, 255)
+                ng = min((r * matrix[1, 0] + g * matrix[1, 1] + b * matrix[1, 2]) >> 8, 255)
+                nb = min((r * matrix[2, 0] + g * matrix[2, 1] + b * matrix[2, 2]) >> 8, 255)
+                r, g, b = nr, ng, nb
+            if brightness != 1:
+                r = _blend(0, r, brightness)
+                g = _blend(0, g, brightness)
+                b = _blend(0, b, brightness)
+            if two_pass:
+                total += _luma(r, g, b)
+            elif saturation != 1:
+                gray = _luma(r, g, b)
+                r = _blend(gray, r, saturation)
+                g = _blend(gray, g, saturation)
+                b = _blend(gray, b, saturation)
+            arr[y, x, 0] = r
+            arr[y, x, 1] = g
+            arr[y, x, 2] = b
+        row_luma[y] = total
+
+    if not two_pass:
+        return
+
+    mean = np.int32(row_luma.sum() / (height * width) + 0.5)
+    for y in prange(height):
+        for x in range(width):
+            r = _blend(mean, np.int32(arr[y, x, 0]), contrast)
+            g = _blend(mean, np.int32(arr[y, x, 1]), contrast)
+            b = _blend(mean, np.int32(arr[y, x, 2]), contrast)
+            if saturation != 1:
+                gray = _luma(r, g, b)
+                r = _blend(gray, r, saturation)
+                g = _blend(gray, g, saturation)
+                b = _blend(gray, b, saturation)
+            arr[y, x, 0] = r
+            arr[y, x, 1] = g
+            arr[y, x, 2] = b
+
+
+def warm_up_color_kernel() -> None:
+    """Compile (or load from Numba's cache) the colour kernel before serving.
+
+    Otherwise the first colour-adjusted request in each worker pays the JIT
+    compile while holding _COLOR_LOCK, stalling every other colour request.
+    """
+    with _COLOR_LOCK:
+        _fused_color(
+            np.zeros((1, 1, 3), dtype=np.uint8), True, SEPIA_I16,
+            np.float32(1.1), np.float32(1.1), np.float32(1.1),
+        )
 
 
-def _generate_processed_key(raw_key: str, options: ImageProcessingOptions) -> str:
-    path = Path(raw_key)
-    stem = path.stem
+def _encode_pillow(img: PILImage.Image, options: ImageProcessingOptions) -> bytes:
+    output_buffer = io.BytesIO()
+    save_format = options.format.value.upper()
+    if save_format == "JPEG":
+        img.save(output_buffer, format="JPEG", quality=options.quality, optimize=True, progressive=True)
+    elif save_format == "PNG":
+        img.save(output_buffer, format="PNG", optimize=True)
+    elif save_format == "WEBP":
+        img.save(output_buffer, format="WEBP", quality=options.quality)
+    return output_buffer.getvalue()
+
+
+def _encode_vips(img: PILImage.Image, options: ImageProcessingOptions) -> bytes:
+    """Encode with libvips (the ``vips`` extra); its PNG path is far faster than Pillow's."""
+    vips_img = pyvips.Image.new_from_memory(
+        img.tobytes(), img.width, img.height, len(img.getbands()), "uchar"
+    )
+    if options.format == ImageFormat.JPEG:
+        return vips_img.jpegsave_buffer(Q=options.quality, optimize_coding=True, interlace=True)
+    if options.format == ImageFormat.PNG:
+        # Adaptive row filters, as Pillow uses, at zlib level 6
+        return vips_img.pngsave_buffer(compression=6, filter="all")
+    return vips_img.webpsave_buffer(Q=options.quality)
+
+
+def generate_processed_key(
+    raw_key: str,
+    options: ImageProcessingOptions,
+    options_dict: dict,
+) -> str:
+    """Build a content-addressed key from the raw key and the processing options."""
+    digest = hashlib.blake2b(
+        raw_key.encode() + orjson.dumps(options_dict, option=orjson.OPT_SORT_KEYS),
+        digest_size=16,
+    ).hexdigest()
 
     size_suffix = options.preset or "custom"
     ext = options.format.value
 
-    return f"processed/{size_suffix}/{stem}.{ext}"
+    return f"processed/{size_suffix}/{digest}.{ext}"
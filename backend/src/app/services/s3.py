@@ -1,9 +1,16 @@
-import io
+import re
+import shutil
+import time
+from collections.abc import Iterable
 from functools import lru_cache
 from pathlib import Path
+from typing import BinaryIO
 
 import boto3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from starlette.concurrency import run_in_threadpool
 
 from ..config import get_settings
 from ..logging_config import get_logger
@@ -11,10 +18,39 @@ from ..logging_config import get_logger
 logger = get_logger(__name__)
 settings = get_settings()
 
+# Streamed uploads go multipart above 5MB, in 1MB parts sent over 4 threads
+STREAM_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=5 * 1024 * 1024,
+    multipart_chunksize=1024 * 1024,
+    max_concurrency=4,
+    use_threads=True,
+)
+
+# One pool shared by request threads and the transfer manager's part uploads;
+# botocore's default of 10 connections forces new TLS handshakes under bursts
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=settings.threadpool_size,
+    tcp_keepalive=True,
+    retries={"mode": "standard"},
+)
+
 
 @lru_cache(maxsize=1)
 def get_s3_client():
-    return boto3.client("s3", region_name=settings.aws_region)
+    return boto3.client("s3", region_name=settings.aws_region, config=S3_CLIENT_CONFIG)
+
+
+@lru_cache(maxsize=1)
+def get_transfer_manager():
+    """Shared transfer manager (and its part-upload threads) on the shared client."""
+    return create_transfer_manager(get_s3_client(), STREAM_TRANSFER_CONFIG)
+
+
+def shutdown_transfer_manager() -> None:
+    """Let in-flight transfers finish and stop the worker threads, if ever started."""
+    if get_transfer_manager.cache_info().currsize:
+        get_transfer_manager().shutdown()
+        get_transfer_manager.cache_clear()
 
 
 def upload_file_to_s3(
@@ -28,16 +64,44 @@ def upload_file_to_s3(
         return _save_locally(file_content, key)
 
     try:
+        # Already in memory, so a single PutObject; no multipart machinery
         s3_client = get_s3_client()
-        s3_client.upload_fileobj(
-            io.BytesIO(file_content),
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=file_content,
+            ContentType=content_type,
+            CacheControl=f"public, max-age={cache_max_age}, immutable",
+        )
+        logger.info(f"Uploaded {key} to {bucket} with cache-control")
+        return True
+    except ClientError as e:
+        logger.error(f"Failed to upload {key} to {bucket}: {e}")
+        return False
+
+
+def upload_file_to_s3_stream(
+    fileobj: BinaryIO,
+    bucket: str,
+    key: str,
+    content_type: str = "image/jpeg",
+    cache_max_age: int = 31536000,
+) -> bool:
+    """Upload from a file-like object without loading it into memory first."""
+    if settings.use_local_storage:
+        return _save_stream_locally(fileobj, key)
+
+    try:
+        future = get_transfer_manager().upload(
+            fileobj,
             bucket,
             key,
-            ExtraArgs={
+            extra_args={
                 "ContentType": content_type,
                 "CacheControl": f"public, max-age={cache_max_age}, immutable",
             },
         )
+        future.result()
         logger.info(f"Uploaded {key} to {bucket} with cache-control")
         return True
     except ClientError as e:
@@ -58,11 +122,91 @@ def download_file_from_s3(bucket: str, key: str) -> bytes | None:
         return None
 
 
+def download_stream_from_s3(bucket: str, key: str) -> BinaryIO | None:
+    """Open an object for reading without loading it into memory; the caller closes it."""
+    if settings.use_local_storage:
+        return _open_locally(key)
+
+    try:
+        s3_client = get_s3_client()
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        return response["Body"]
+    except ClientError as e:
+        logger.error(f"Failed to download {key} from {bucket}: {e}")
+        return None
+
+
+def file_exists_in_s3(bucket: str, key: str) -> bool:
+    """Check for an object with a HEAD request, without fetching its body."""
+    if settings.use_local_storage:
+        return (Path(settings.local_storage_path) / key).is_file()
+
+    try:
+        get_s3_client().head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError:
+        return False
+
+
+# https://{bucket}.s3.{region}.amazonaws.com/{key}
+_S3_URL_RE = re.compile(r"^https://([^/]+?)\.s3\.[^/]+\.amazonaws\.com/(.+)$")
+
+
+@lru_cache(maxsize=4096)
+def extract_key(url: str) -> tuple[str | None, str]:
+    """Split a stored image URL into (bucket, key).
+
+    Works for both local (/uploads/...) and S3 URLs. The bucket is None when
+    the URL does not name one; unknown formats are returned as the key.
+    """
+    if url.startswith("/uploads/"):
+        return None, url[len("/uploads/"):]
+    match = _S3_URL_RE.match(url)
+    if match:
+        return match.group(1), match.group(2)
+    if url.startswith("https://"):
+        return None, url.split("/", 3)[-1]
+    return None, url
+
+
+@lru_cache(maxsize=16)
+def get_public_url_template(bucket: str) -> str:
+    """Return the URL prefix that public object keys are appended to."""
+    if settings.use_local_storage:
+        return "/uploads/"
+
+    return f"https://{bucket}.s3.{settings.aws_region}.amazonaws.com/"
+
+
 def get_public_url(bucket: str, key: str) -> str:
+    return get_public_url_template(bucket) + key
+
+
+@lru_cache(maxsize=16)
+def get_unsigned_url_prefix(bucket: str) -> str | None:
+    """Return the prefix for buckets readable without a signature, else None."""
     if settings.use_local_storage:
-        return f"/uploads/{key}"
+        return get_public_url_template(bucket)
+    if settings.s3_public_base_url and bucket == settings.s3_bucket_processed:
+        return settings.s3_public_base_url.rstrip("/") + "/"
+    return None
+
+
+# Responses revalidated against database state (rather than their bodies)
+# may replay presigned URLs signed up to this long before; well inside the
+# default one-hour expiry
+PRESIGN_REUSE_SECONDS = 300
+
 
-    return f"https://{bucket}.s3.{settings.aws_region}.amazonaws.com/{key}"
+def presign_window() -> int | None:
+    """Index of the current URL-reuse window, or None when URLs are never signed.
+
+    Part of ETag validators for bodies with presigned URLs: the tag changes
+    when the window rolls over, so clients fetch freshly signed URLs by then.
+    """
+    if settings.use_local_storage:
+        return None
+    return int(time.time()) // PRESIGN_REUSE_SECONDS
 
 
 def generate_presigned_url(
@@ -70,8 +214,9 @@ def generate_presigned_url(
     key: str,
     expiration: int = 3600,
 ) -> str | None:
-    if settings.use_local_storage:
-        return f"/uploads/{key}"
+    prefix = get_unsigned_url_prefix(bucket)
+    if prefix is not None:
+        return prefix + key
 
     try:
         s3_client = get_s3_client()
@@ -86,6 +231,32 @@ def generate_presigned_url(
         return None
 
 
+def generate_presigned_urls(
+    bucket: str,
+    keys: Iterable[str],
+    expiration: int = 3600,
+) -> dict[str, str | None]:
+    """Presign many keys from one bucket, signing each distinct key only once."""
+    prefix = get_unsigned_url_prefix(bucket)
+    if prefix is not None:
+        return {key: prefix + key for key in keys}
+
+    return {key: generate_presigned_url(bucket, key, expiration) for key in dict.fromkeys(keys)}
+
+
+async def generate_presigned_urls_async(
+    bucket: str,
+    keys: Iterable[str],
+    expiration: int = 3600,
+) -> dict[str, str | None]:
+    """Batch-presign keys in the threadpool so signing never runs on the event loop."""
+    if get_unsigned_url_prefix(bucket) is not None:
+        # Only string concatenation; a thread hop would cost more than the work
+        return generate_presigned_urls(bucket, keys, expiration)
+
+    return await run_in_threadpool(generate_presigned_urls, bucket, list(keys), expiration)
+
+
 def generate_presigned_download_url(
     bucket: str,
     key: str,
@@ -124,6 +295,19 @@ def _save_locally(content: bytes, key: str) -> bool:
         return False
 
 
+def _save_stream_locally(fileobj: BinaryIO, key: str) -> bool:
+    try:
+        path = Path(settings.local_storage_path) / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        logger.info(f"Saved locally: {path}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save locally {key}: {e}")
+        return False
+
+
 def _read_locally(key: str) -> bytes | None:
     try:
         path = Path(settings.local_storage_path) / key
@@ -133,6 +317,15 @@ def _read_locally(key: str) -> bytes | None:
         return None
 
 
+def _open_locally(key: str) -> BinaryIO | None:
+    try:
+        path = Path(settings.local_storage_path) / key
+        return path.open("rb")
+    except Exception as e:
+        logger.error(f"Failed to read locally {key}: {e}")
+        return None
+
+
 def delete_file_from_s3(bucket: str, key: str) -> bool:
     if settings.use_local_storage:
         return _delete_locally(key)
@@ -147,6 +340,30 @@ def delete_file_from_s3(bucket: str, key: str) -> bool:
         return False
 
 
+def delete_files_from_s3(bucket: str, keys: Iterable[str]) -> bool:
+    """Delete several keys from one bucket with a single DeleteObjects call."""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return True
+    if settings.use_local_storage:
+        return all([_delete_locally(key) for key in keys])
+
+    try:
+        s3_client = get_s3_client()
+        response = s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        errors = response.get("Errors", [])
+        for error in errors:
+            logger.error(f"Failed to delete {error.get('Key')} from {bucket}: {error.get('Message')}")
+        logger.info(f"Deleted {len(keys) - len(errors)} objects from {bucket}")
+        return not errors
+    except ClientError as e:
+        logger.error(f"Failed to delete {keys} from {bucket}: {e}")
+        return False
+
+
 def _delete_locally(key: str) -> bool:
     try:
         path = Path(settings.local_storage_path) / key
@@ -1,50 +1,95 @@
+import asyncio
+import os
 import sys
 from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.pool import StaticPool
 
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Tests build their own in-memory schema; don't touch the configured database
+os.environ.setdefault("AUTO_CREATE_TABLES", "false")
+# Minimum bcrypt cost; hashing strength is irrelevant for test users
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
 from src.app.database import Base, get_db
 from src.app.main import app
 from src.app.routers.auth import limiter
+from src.app.services.auth import clear_user_cache
 
 
-@pytest.fixture(scope="function")
-def db_session():
-    """Create a new database session for each test."""
-    engine = create_engine(
-        "sqlite:///:memory:",
-        connect_args={"check_same_thread": False},
+@pytest.fixture(scope="session")
+def engine():
+    """Create the in-memory schema once for the whole test session."""
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
         poolclass=StaticPool,
     )
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    Base.metadata.create_all(bind=engine)
 
-    session = TestingSessionLocal()
+    # pysqlite's implicit transactions break SAVEPOINT; emit BEGIN ourselves
+    @event.listens_for(engine.sync_engine, "connect")
+    def disable_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_tables())
+    try:
+        yield engine
+    finally:
+        asyncio.run(engine.dispose())
+
+
+@pytest.fixture(scope="function")
+def db_session(engine):
+    """Create a session whose changes are rolled back after each test.
+
+    Commits made by the code under test only release a SAVEPOINT inside the
+    outer transaction, so every test starts from the empty schema.
+    """
+    async def begin():
+        connection = await engine.connect()
+        transaction = await connection.begin()
+        session = AsyncSession(
+            bind=connection,
+            autoflush=False,
+            expire_on_commit=False,
+            join_transaction_mode="create_savepoint",
+        )
+        return connection, transaction, session
+
+    async def rollback():
+        await session.close()
+        await transaction.rollback()
+        await connection.close()
+
+    connection, transaction, session = asyncio.run(begin())
     try:
         yield session
     finally:
-        session.close()
-        Base.metadata.drop_all(bind=engine)
+        asyncio.run(rollback())
 
 
 @pytest.fixture(scope="function")
 def client(db_session):
     """Create a test client with overridden database dependency."""
-    # Reset rate limiter storage between tests
+    # Reset rate limiter storage and cached token users between tests
     limiter.reset()
+    clear_user_cache()
 
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+    async def override_get_db():
+        yield db_session
 
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as test_client:
@@ -1,5 +1,11 @@
 """Tests for authentication endpoints."""
 
+import asyncio
+from unittest.mock import patch
+
+from src.app import crud
+from src.app.services.auth import _users_by_username, get_password_hash, settings, verify_password
+
 
 class TestRegistration:
     """Tests for user registration."""
@@ -63,6 +69,47 @@ class TestLogin:
         assert response.status_code == 401
 
 
+class TestPasswordVerification:
+    """Tests for the verified-password cache."""
+
+    def test_repeat_success_skips_bcrypt(self):
+        """Test a recently verified password is not re-hashed."""
+        hashed = get_password_hash("cachedpassword")
+        assert verify_password("cachedpassword", hashed)
+        with patch("src.app.services.auth.bcrypt.checkpw") as checkpw:
+            assert verify_password("cachedpassword", hashed)
+        checkpw.assert_not_called()
+
+    def test_failures_are_not_cached(self):
+        """Test a wrong password is checked by bcrypt every time."""
+        hashed = get_password_hash("cachedpassword")
+        assert not verify_password("wrongpassword", hashed)
+        with patch("src.app.services.auth.bcrypt.checkpw", return_value=False) as checkpw:
+            assert not verify_password("wrongpassword", hashed)
+        checkpw.assert_called_once()
+
+    def test_argon2_hashes_verify(self):
+        """Test Argon2id hashes are created and checked when configured."""
+        with patch.object(settings, "password_hasher", "argon2"):
+            hashed = get_password_hash("argonpassword")
+        assert hashed.startswith("$argon2id$")
+        assert verify_password("argonpassword", hashed)
+        assert not verify_password("wrongpassword", hashed)
+
+    def test_login_upgrades_bcrypt_hash(self, client, db_session, test_user_data, registered_user):
+        """Test a bcrypt hash is replaced with Argon2id at login when configured."""
+        login_data = {
+            "username": test_user_data["username"],
+            "password": test_user_data["password"],
+        }
+        with patch.object(settings, "password_hasher", "argon2"):
+            assert client.post("/api/auth/login", json=login_data).status_code == 200
+
+        user = asyncio.run(crud.get_user_by_username(db_session, test_user_data["username"]))
+        assert user.hashed_password.startswith("$argon2id$")
+        assert client.post("/api/auth/login", json=login_data).status_code == 200
+
+
 class TestProtectedRoutes:
     """Tests for protected endpoints."""
 
@@ -83,3 +130,19 @@ class TestProtectedRoutes:
         headers = {"Authorization": "Bearer invalid-token"}
         response = client.get("/api/auth/me", headers=headers)
         assert response.status_code == 401
+
+    def test_token_user_is_cached(self, client, auth_headers):
+        """Test a repeat request with the same token skips the user query."""
+        assert client.get("/api/auth/me", headers=auth_headers).status_code == 200
+        with patch("src.app.services.auth.select", side_effect=AssertionError("queried")):
+            response = client.get("/api/auth/me", headers=auth_headers)
+        assert response.status_code == 200
+
+    def test_password_change_evicts_cached_user(self, client, db_session, auth_headers, test_user_data):
+        """Test a password update drops the user from the token-user cache."""
+        assert client.get("/api/auth/me", headers=auth_headers).status_code == 200
+        user = asyncio.run(crud.get_user_by_username(db_session, test_user_data["username"]))
+        assert user.username in _users_by_username
+
+        asyncio.run(crud.update_user_password(db_session, user, "newpass123"))
+        assert user.username not in _users_by_username
@@ -0,0 +1,133 @@
+"""Tests for the image processing pipeline."""
+import io
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance
+
+from src.app.schemas import ImageFormat, ImageProcessingOptions
+from src.app.services import image_processor
+from src.app.services.image_processor import PRESET_SIZES, _apply_color, _apply_resize, _draft_size
+
+
+def _random_rgb(width: int = 96, height: int = 64) -> Image.Image:
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+class TestColorAdjustments:
+    """Tests for the fused colour kernel against Pillow's ImageEnhance chain."""
+
+    @pytest.mark.parametrize(
+        "brightness,contrast,saturation",
+        [(20, 0, 0), (0, 40, 0), (0, 0, -50), (10, -20, 30), (-100, 100, 100), (50, 50, 50)],
+    )
+    def test_matches_image_enhance(self, brightness, contrast, saturation):
+        """Test brightness, contrast and saturation match ImageEnhance pixel for pixel."""
+        img = _random_rgb()
+        expected = img
+        if brightness:
+            expected = ImageEnhance.Brightness(expected).enhance(1 + brightness / 100)
+        if contrast:
+            expected = ImageEnhance.Contrast(expected).enhance(1 + contrast / 100)
+        if saturation:
+            expected = ImageEnhance.Color(expected).enhance(1 + saturation / 100)
+
+        options = ImageProcessingOptions(brightness=brightness, contrast=contrast, saturation=saturation)
+        result = _apply_color(img.copy(), options)
+
+        assert result.mode == "RGB"
+        assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+    def test_grayscale_without_adjustments_is_untouched(self):
+        """Test an L image with nothing to apply is returned as-is, single-channel."""
+        img = _random_rgb().convert("L")
+        assert _apply_color(img, ImageProcessingOptions()) is img
+
+
+class TestResize:
+    """Tests for Lanczos3 resizing against Pillow's sizing rules."""
+
+    @pytest.mark.parametrize("preset", sorted(PRESET_SIZES))
+    @pytest.mark.parametrize("size", [(4000, 3000), (1234, 4321), (2000, 500), (801, 799), (100, 80)])
+    def test_preset_sizes_match_thumbnail(self, preset, size):
+        """Test each preset yields the dimensions Image.thumbnail would."""
+        img = Image.new("RGB", size)
+        expected = img.copy()
+        expected.thumbnail(PRESET_SIZES[preset], Image.Resampling.LANCZOS)
+
+        result = _apply_resize(img, ImageProcessingOptions(preset=preset))
+
+        assert result.size == expected.size
+        assert result.mode == "RGB"
+
+
+class TestDraftDecode:
+    """Tests for JPEG draft-mode decoding ahead of the resize."""
+
+    @pytest.fixture(scope="class")
+    def jpeg_bytes(self):
+        buffer = io.BytesIO()
+        _random_rgb(4000, 3000).save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    @pytest.mark.parametrize(
+        "options",
+        [
+            {"preset": "thumbnail"},
+            {"preset": "medium"},
+            {"preset": "large"},
+            {"width": 200},
+            {"height": 200},
+            {"width": 300, "height": 100},
+            {"width": 300, "height": 100, "maintain_aspect": False},
+        ],
+    )
+    def test_draft_never_decodes_below_target(self, jpeg_bytes, options):
+        """Test the drafted decode is at least as large as the resize target."""
+        options = ImageProcessingOptions(**options)
+        full = Image.open(io.BytesIO(jpeg_bytes))
+        target = _apply_resize(full, options).size
+
+        drafted = Image.open(io.BytesIO(jpeg_bytes))
+        draft_size = _draft_size(drafted, options)
+        drafted.draft(None, (draft_size[0] * 2, draft_size[1] * 2))
+
+        assert drafted.width >= target[0] and drafted.height >= target[1]
+        assert _apply_resize(drafted, options).size == target
+
+
+class TestTransparencyToJpeg:
+    """Tests for transparent sources encoded as JPEG."""
+
+    @pytest.mark.parametrize("mode", ["RGBA", "P"])
+    def test_transparent_areas_become_white(self, mode):
+        """Test alpha is flattened onto white after the resize, not dropped to black."""
+        source = Image.new("RGBA", (800, 600), (0, 0, 0, 0))
+        ImageDraw.Draw(source).ellipse((200, 100, 600, 500), fill=(255, 0, 0, 255))
+        if mode == "P":
+            source = source.quantize(method=Image.Quantize.FASTOCTREE)
+        buffer = io.BytesIO()
+        source.save(buffer, format="PNG")
+        stored = {}
+
+        def upload(content, bucket, key, content_type=None):
+            stored["content"] = content
+            return True
+
+        with (
+            patch.object(image_processor, "file_exists_in_s3", return_value=False),
+            patch.object(image_processor, "download_stream_from_s3", return_value=io.BytesIO(buffer.getvalue())),
+            patch.object(image_processor, "upload_file_to_s3", side_effect=upload),
+        ):
+            options = ImageProcessingOptions(preset="thumbnail", format=ImageFormat.JPEG)
+            assert image_processor.process_image("raw/1/source.png", options=options)
+
+        result = Image.open(io.BytesIO(stored["content"]))
+        assert result.format == "JPEG"
+        assert result.size == (150, 113)
+        corner = result.getpixel((2, 2))
+        centre = result.getpixel((75, 56))
+        assert min(corner) >= 250
+        assert centre[0] >= 240 and max(centre[1:]) <= 15
@@ -1,6 +1,19 @@
 """Tests for image endpoints with user ownership."""
+import asyncio
 import io
-from unittest.mock import patch
+import time
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.app import crud
+from src.app.config import get_settings
+from src.app.models import ImageStatus, StorageRef
+from src.app.services import s3
+
+settings = get_settings()
 
 
 class TestImageOwnership:
@@ -23,9 +36,10 @@ class TestImageOwnership:
         assert response.status_code == 200
         assert response.json() == []
 
-    @patch("src.app.routers.images.s3.upload_file_to_s3", return_value=True)
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=False)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
     @patch("src.app.routers.images.process_image", return_value=("key", "/uploads/img.jpg"))
-    def test_upload_image_authenticated(self, mock_process, mock_s3, client, auth_headers):
+    def test_upload_image_authenticated(self, mock_process, mock_s3, mock_exists, client, auth_headers):
         """Test authenticated user can upload image."""
         files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
         response = client.post("/api/upload", files=files, headers=auth_headers)
@@ -34,10 +48,20 @@ class TestImageOwnership:
         assert data["filename"] == "test.jpg"
         assert "id" in data
 
-    @patch("src.app.routers.images.s3.upload_file_to_s3", return_value=True)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
+    def test_upload_rejects_oversized_file(self, mock_s3, client, auth_headers):
+        """Test uploads over 10MB are rejected before reaching storage."""
+        big = io.BytesIO(b"\0" * (10 * 1024 * 1024 + 1))
+        files = {"file": ("big.jpg", big, "image/jpeg")}
+        response = client.post("/api/upload", files=files, headers=auth_headers)
+        assert response.status_code == 413
+        mock_s3.assert_not_called()
+
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=False)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
     @patch("src.app.routers.images.process_image", return_value=("key", "/uploads/img.jpg"))
     def test_user_can_only_see_own_images(
-        self, mock_process, mock_s3, client, db_session
+        self, mock_process, mock_s3, mock_exists, client, db_session
     ):
         """Test users can only see their own images."""
         # Create user 1 and upload image
@@ -66,3 +90,234 @@ class TestImageOwnership:
         # User 2 should get 404 for User 1's image
         image_resp = client.get(f"/api/images/{user1_image_id}", headers=headers2)
         assert image_resp.status_code == 404
+
+
+class TestUploadDeduplication:
+    """Tests for content-addressed raw storage."""
+
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=True)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
+    @patch("src.app.routers.images.process_image", return_value=("key", "/uploads/img.jpg"))
+    def test_identical_upload_reuses_raw_object(
+        self, mock_process, mock_s3, mock_exists, client, auth_headers
+    ):
+        """Test a repeated upload is not stored again and maps to the same raw key."""
+        for name in ("first.jpg", "second.jpg"):
+            files = {"file": (name, io.BytesIO(b"same image data"), "image/jpeg")}
+            assert client.post("/api/upload", files=files, headers=auth_headers).status_code == 200
+
+        mock_s3.assert_called_once()
+        raw_keys = {call.args[0] for call in mock_process.call_args_list}
+        assert len(raw_keys) == 1
+
+    @patch("src.app.routers.images.s3.delete_files_from_s3", return_value=True)
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=False)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
+    @patch(
+        "src.app.routers.images.process_image",
+        side_effect=lambda raw_key, processed_key, **kwargs: (processed_key, f"/uploads/{processed_key}"),
+    )
+    def test_shared_objects_deleted_with_last_image(
+        self, mock_process, mock_s3, mock_exists, mock_delete, client, auth_headers
+    ):
+        """Test stored objects survive until no image references them."""
+        ids = []
+        for name in ("first.jpg", "second.jpg"):
+            files = {"file": (name, io.BytesIO(b"same image data"), "image/jpeg")}
+            ids.append(client.post("/api/upload", files=files, headers=auth_headers).json()["id"])
+
+        assert client.delete(f"/api/images/{ids[0]}", headers=auth_headers).status_code == 200
+        mock_delete.assert_not_called()
+
+        assert client.delete(f"/api/images/{ids[1]}", headers=auth_headers).status_code == 200
+        deleted = {call.args[0]: call.args[1] for call in mock_delete.call_args_list}
+        assert deleted == {
+            settings.s3_bucket_raw: [mock_process.call_args.args[0]],
+            settings.s3_bucket_processed: [mock_process.call_args.kwargs["processed_key"]],
+        }
+
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=False)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
+    @patch("src.app.routers.images.process_image", return_value=("key", "/uploads/img.jpg"))
+    def test_identical_uploads_by_different_users_do_not_share(
+        self, mock_process, mock_s3, mock_exists, client, auth_headers
+    ):
+        """Test storage keys are scoped to the uploading user."""
+        other = {"username": "other", "email": "other@test.com", "password": "password123"}
+        client.post("/api/auth/register", json=other)
+        token = client.post("/api/auth/login", json=other).json()["access_token"]
+
+        for headers in (auth_headers, {"Authorization": f"Bearer {token}"}):
+            files = {"file": ("same.jpg", io.BytesIO(b"same image data"), "image/jpeg")}
+            assert client.post("/api/upload", files=files, headers=headers).status_code == 200
+
+        assert mock_s3.call_count == 2
+        raw_keys = {call.args[0] for call in mock_process.call_args_list}
+        assert len(raw_keys) == 2
+
+
+
+class TestStorageRefs:
+    """Tests for reference counts on stored objects."""
+
+    def test_concurrent_first_acquires_both_count(self, db_session):
+        """Test a key created by another request between UPDATE and INSERT counts both."""
+        key = "raw/1/racing.jpg"
+        other = AsyncSession(bind=db_session.bind, join_transaction_mode="create_savepoint")
+        created_by_other = set()
+        execute = db_session.execute
+
+        async def racing_execute(statement, *args, **kwargs):
+            result = await execute(statement, *args, **kwargs)
+            if not created_by_other:
+                # The other acquire finds no row either and inserts it first
+                created_by_other.update(await crud.acquire_storage_refs(other, [key]))
+            return result
+
+        async def acquire():
+            with patch.object(db_session, "execute", racing_execute):
+                created = await crud.acquire_storage_refs(db_session, [key])
+            await other.close()
+            return created
+
+        assert asyncio.run(acquire()) == set()
+        assert created_by_other == {key}
+        refs = asyncio.run(db_session.scalar(select(StorageRef.refs).where(StorageRef.key == key)))
+        assert refs == 2
+
+    @patch("src.app.routers.images.s3.delete_files_from_s3", return_value=True)
+    def test_legacy_objects_deleted_after_backfill(
+        self, mock_delete, client, db_session, auth_headers
+    ):
+        """Test images stored before reference counting delete their objects once backfilled."""
+        user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+        raw_key, processed_key = "raw/legacy.jpg", "legacy_thumbnail.jpg"
+        processed_url = s3.get_public_url(settings.s3_bucket_processed, processed_key)
+
+        async def insert_legacy_image():
+            image = await crud.create_image(
+                db_session,
+                filename="legacy.jpg",
+                s3_key_raw=raw_key,
+                user_id=user_id,
+                status=ImageStatus.COMPLETED,
+                s3_url_processed=processed_url,
+            )
+            # An edit with the upload's options points at the same object
+            await crud.update_image_edited(db_session, image.id, processed_url)
+            return image.id
+
+        image_id = asyncio.run(insert_legacy_image())
+        assert asyncio.run(crud.backfill_storage_refs(db_session)) == 2
+        assert asyncio.run(crud.backfill_storage_refs(db_session)) == 0
+
+        assert client.delete(f"/api/images/{image_id}", headers=auth_headers).status_code == 200
+        deleted = {call.args[0]: call.args[1] for call in mock_delete.call_args_list}
+        assert deleted == {
+            settings.s3_bucket_raw: [raw_key],
+            settings.s3_bucket_processed: [processed_key],
+        }
+
+
+class TestImageListCaching:
+    """Tests for conditional GETs on image list endpoints."""
+
+    @patch(
+        "src.app.routers.images.s3.generate_presigned_urls_async",
+        new=AsyncMock(side_effect=lambda bucket, keys: {key: f"/uploads/{key}" for key in keys}),
+    )
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=False)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
+    @patch("src.app.routers.images.process_image", return_value=("key", "/uploads/img.jpg"))
+    def test_list_revalidates_with_etag(self, mock_process, mock_s3, mock_exists, client, auth_headers):
+        """Test an unchanged list answers If-None-Match with 304 and a changed one does not."""
+        files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+        client.post("/api/upload", files=files, headers=auth_headers)
+
+        first = client.get("/api/images", headers=auth_headers)
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "private, no-cache"
+
+        cached = client.get("/api/images", headers={**auth_headers, "If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+        files = {"file": ("second.jpg", io.BytesIO(b"more image data"), "image/jpeg")}
+        client.post("/api/upload", files=files, headers=auth_headers)
+        changed = client.get("/api/images", headers={**auth_headers, "If-None-Match": etag})
+        assert changed.status_code == 200
+        assert len(changed.json()) == 2
+
+
+    # Pin the reuse window so the test cannot straddle a rollover
+    @patch("src.app.routers.images.s3.presign_window", return_value=0)
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=False)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
+    @patch("src.app.routers.images.process_image", return_value=("key", "/uploads/img.jpg"))
+    def test_list_revalidates_with_real_presigned_urls(
+        self, mock_process, mock_s3, mock_exists, mock_window, client, auth_headers, monkeypatch
+    ):
+        """Test a re-signed but otherwise unchanged list still answers 304."""
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+        s3.get_s3_client.cache_clear()
+        files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+        client.post("/api/upload", files=files, headers=auth_headers)
+
+        try:
+            first = client.get("/api/images", headers=auth_headers)
+            # Signatures cover a timestamp with one-second resolution
+            time.sleep(1.1)
+            second = client.get("/api/images", headers=auth_headers)
+            cached = client.get("/api/images", headers={**auth_headers, "If-None-Match": first.headers["etag"]})
+        finally:
+            s3.get_s3_client.cache_clear()
+
+        assert "Signature=" in first.json()[0]["original_url"]
+        assert first.json()[0]["original_url"] != second.json()[0]["original_url"]
+        assert second.headers["etag"] == first.headers["etag"]
+        assert cached.status_code == 304
+
+
+class TestImageListPayload:
+    """Tests for gallery ordering, upload timestamps and stored options."""
+
+    @patch(
+        "src.app.routers.images.s3.generate_presigned_urls_async",
+        new=AsyncMock(side_effect=lambda bucket, keys: {key: f"/uploads/{key}" for key in keys}),
+    )
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=False)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
+    @patch("src.app.routers.images.process_image", return_value=("key", "/uploads/img.jpg"))
+    def test_newest_first_with_utc_upload_dates(self, mock_process, mock_s3, mock_exists, client, auth_headers):
+        """Test uploads list newest first, even within one timestamp, with UTC dates."""
+        ids = []
+        for i in range(3):
+            files = {"file": (f"{i}.jpg", io.BytesIO(f"image {i}".encode()), "image/jpeg")}
+            ids.append(client.post("/api/upload", files=files, headers=auth_headers).json()["id"])
+
+        images = client.get("/api/images", headers=auth_headers).json()
+        assert [image["id"] for image in images] == ids[::-1]
+
+        uploaded_at = datetime.fromisoformat(images[0]["uploaded_at"]).replace(tzinfo=timezone.utc)
+        assert abs((datetime.now(timezone.utc) - uploaded_at).total_seconds()) < 60
+
+    @patch(
+        "src.app.routers.images.s3.generate_presigned_urls_async",
+        new=AsyncMock(side_effect=lambda bucket, keys: {key: f"/uploads/{key}" for key in keys}),
+    )
+    @patch("src.app.routers.images.s3.file_exists_in_s3", return_value=False)
+    @patch("src.app.routers.images.s3.upload_file_to_s3_stream", return_value=True)
+    @patch("src.app.routers.images.process_image", return_value=("key", "/uploads/img.jpg"))
+    def test_options_limited_to_declared_fields(
+        self, mock_process, mock_s3, mock_exists, client, db_session, auth_headers
+    ):
+        """Test stored options are projected onto the schema, with defaults filled in."""
+        files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+        image_id = client.post("/api/upload", files=files, headers=auth_headers).json()["id"]
+        asyncio.run(crud.update_image_edited(db_session, image_id, "/uploads/edit.jpg", {"rotate": 90, "legacy": 1}))
+
+        options = client.get("/api/images", headers=auth_headers).json()[0]["options"]
+        assert options["rotate"] == 90
+        assert options["quality"] == 85
+        assert "legacy" not in options